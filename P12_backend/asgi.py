@@ -2,6 +2,8 @@
 ASGI config for P12_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+/api/stream/ is served by the Server-Sent Events application of the API,
+every other request by Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'P12_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once Django is set up
+from apps.API.stream import stream_application  # noqa: E402
+
+STREAM_PATHS = ('/api/stream', '/api/stream/')
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in STREAM_PATHS:
+        await stream_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,10 @@
+def percentile(timings, rank):
+    """
+    function to get a percentile from a list of timings, shared by the
+    bench commands
+    :param timings: sorted list of floats
+    :param rank: int, percentile wanted
+    :return: float
+    """
+    index = round(rank / 100 * (len(timings) - 1))
+    return timings[index]
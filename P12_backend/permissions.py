@@ -1,5 +1,5 @@
 from rest_framework.permissions import BasePermission
-from apps.authenticate.models import CustomUser
+from rest_framework_simplejwt.tokens import Token
 
 
 class GroupMixin:
@@ -7,18 +7,25 @@ class GroupMixin:
     mixin to add a get_group method by inheritance
     """
     def get_group_list(self, user):
-        group_list = []
-        for group in user.groups.all():
-            group_list.append(group.name)
-        return group_list
+        return list(user.get_roles())
+
+    def get_request_roles(self, request):
+        """
+        get the roles of the request's user, from the access token claims
+        when present, from the user's groups otherwise
+        :param request: API request
+        :return: list of groups' name
+        """
+        if isinstance(request.auth, Token) and 'roles' in request.auth:
+            return request.auth['roles']
+        return self.get_group_list(request.user)
 
 class IsManager(BasePermission, GroupMixin):
     """
     permission that return True if the user is a manager
     """
     def has_permission(self, request, view):
-        user = CustomUser.objects.get(id=request.user.id)
-        if 'manager' in self.get_group_list(user):
+        if 'manager' in self.get_request_roles(request):
             return True
         else:
             return False
@@ -29,8 +36,7 @@ class IsSales(BasePermission, GroupMixin):
     permission that return True if user is sales
     """
     def has_permission(self, request, view):
-        user = CustomUser.objects.get(id=request.user.id)
-        perms = self.get_group_list(user)
+        perms = self.get_request_roles(request)
         if 'sales' in perms or 'manager' in perms:
             return True
         else:
@@ -42,8 +48,7 @@ class IsSupport(BasePermission, GroupMixin):
     permission that return True is user is support
     """
     def has_permission(self, request, view):
-        user = CustomUser.objects.get(id=request.user.id)
-        perms = self.get_group_list(user)
+        perms = self.get_request_roles(request)
         if 'support' in perms or 'manager' in perms:
             return True
         else:
@@ -55,8 +60,8 @@ class IsSaleReferee(BasePermission, GroupMixin):
     permission that return True if the user is the sale_contact of an object
     """
     def has_object_permission(self, request, view, obj):
-        if obj.sale_contact == request.user \
-                or 'manager' in self.get_group_list(request.user):
+        if obj.sale_contact_id == request.user.id \
+                or 'manager' in self.get_request_roles(request):
             return True
         else:
             return False
@@ -67,8 +72,8 @@ class IsSupportReferee(BasePermission, GroupMixin):
     permission that return True if user is support_contact of an event
     """
     def has_object_permission(self, request, view, obj):
-        if obj.support_contact == request.user \
-                or 'manager' in self.get_group_list(request.user):
+        if obj.support_contact_id == request.user.id \
+                or 'manager' in self.get_request_roles(request):
             return True
         else:
             return False
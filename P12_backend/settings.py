@@ -93,6 +93,16 @@ DATABASES = {
 }
 
 
+# Cache shared by the processes, holding the token versions and the versions
+# of the users data used by the API validators and the front forms choices
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': '127.0.0.1:11211',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -144,10 +154,12 @@ LOGOUT_REDIRECT_URL = LOGIN_URL
 
 #API config
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'apps.API.pagination.CountModePagination',
     'PAGE_SIZE': 5,
+    # 'apps.authenticate.authentication.StatelessJWTAuthentication' builds
+    # the user from the token claims, without loading it from the DB
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authenticate.authentication.VersionedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS':
         ('django_filters.rest_framework.DjangoFilterBackend',),
@@ -158,6 +170,64 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=10)
 }
 
+# number of verified tokens kept to skip their signature verification
+JWT_VERIFIED_TOKENS_CACHE_SIZE = 1024
+
+# seconds before the customers autocomplete index of a process is rebuilt,
+# to catch the changes made by the other processes
+AUTOCOMPLETE_INDEX_TTL = 300
+
+# cache of the customers, contracts and events retrieve responses, invalidated
+# by the models signals. DjangoCacheBackend stores them in the CACHES alias
+# shared by the processes, so an invalidation is seen by all of them.
+# apps.API.cache.LRUCacheBackend with OPTIONS {'maxsize': <entries>} keeps
+# them in the memory of each process, only for single process deployments:
+# the other processes would serve outdated details until TIMEOUT.
+# Set BACKEND to None to disable it.
+API_RETRIEVE_CACHE = {
+    'BACKEND': 'apps.API.cache.DjangoCacheBackend',
+    'OPTIONS': {'alias': 'default'},
+    'TIMEOUT': 300,
+}
+
+# threads running the sections of api/search/, 1 to run them in the request
+# thread
+API_SEARCH_CONCURRENCY = 4
+
+# days the deletions are kept for the deleted/?since= sync feeds, older
+# tombstones are removed by the purge_tombstones command
+SYNC_TOMBSTONE_DAYS = 90
+
+# Server-Sent Events stream of the changes, served at /api/stream/ by
+# P12_backend.asgi. BROKER is the pub/sub fed by the model signals:
+# LocalBroker only sees the changes of its own process, which is enough for
+# a single ASGI process. With several processes use
+# apps.API.stream.DatabaseBroker, adding to OPTIONS 'interval' (seconds
+# between two polls) and 'retention' (seconds the rows are kept): each
+# change is then written to a table.
+# KEEPALIVE is the seconds between two keepalive comments, MAX_DURATION the
+# seconds before a stream ends and the client reconnects.
+API_STREAM = {
+    'BROKER': 'apps.API.stream.LocalBroker',
+    'OPTIONS': {'queue_size': 100},
+    'KEEPALIVE': 15,
+    'MAX_DURATION': 3600,
+}
+
+# Front app API client config
+# TRANSPORT can be 'apps.front.api_client.HttpTransport' to reach the API
+# over HTTP instead of dispatching requests in process
+# CONCURRENCY is the max number of pages fetched at the same time when a
+# full result set is needed
+# VALIDATOR_CACHE_SIZE is the number of GET responses kept with their ETag
+# to be revalidated with If-None-Match, 0 to disable it
+FRONT_API = {
+    'URL': 'http://127.0.0.1:8000/api/',
+    'TRANSPORT': 'apps.front.api_client.InProcessTransport',
+    'CONCURRENCY': 4,
+    'VALIDATOR_CACHE_SIZE': 512,
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
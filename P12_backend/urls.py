@@ -15,11 +15,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from apps.authenticate.views import RegisterView, UserViewset, UpdatePassword
+from apps.authenticate.views import RegisterView, UserViewset, \
+    UpdatePassword, RoleTokenObtainPairView, VersionedTokenRefreshView
 import apps.API.views as APIviews
 from apps.front import views as front
-from rest_framework_simplejwt.views import TokenObtainPairView, \
-    TokenRefreshView
 from django.contrib.auth.views import LogoutView
 from apps.front.views import LoginView
 from rest_framework import routers
@@ -35,9 +34,12 @@ urlpatterns = [
 
     # API endpoint
     path('api/', include(router.urls)),
-    path('api/login/', TokenObtainPairView.as_view(),
+    path('api/search/', APIviews.SearchView.as_view(), name='api_search'),
+    path('api/dashboard/sales/', APIviews.SalesDashboardView.as_view(),
+         name='sales_dashboard'),
+    path('api/login/', RoleTokenObtainPairView.as_view(),
          name='token_obtains_pairs'),
-    path('api/login/refresh/', TokenRefreshView.as_view(),
+    path('api/login/refresh/', VersionedTokenRefreshView.as_view(),
          name='refresh_token'),
     path('api/signup/', RegisterView.as_view(), name='auth_register'),
     path('api/password_update/',
@@ -1,12 +1,133 @@
+from datetime import datetime
+from django.utils import timezone
 from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
+from rest_framework.filters import OrderingFilter
 from .models import *
 
-class ContractFilter(filters.FilterSet):
+
+PERIOD_FORMATS = (
+    ('%Y-%m-%d', 'day'),
+    ('%d/%m/%Y', 'day'),
+    ('%Y-%m', 'month'),
+    ('%m/%Y', 'month'),
+    ('%Y', 'year'),
+)
+
+
+def get_period(year, month=None, day=None):
+    """
+    function to get the datetime range covering a year, a month or a day
+    :return: tuple of aware datetimes (start, end), end excluded, or None if
+    the date doesn't exist
+    """
+    try:
+        if day is not None:
+            start = datetime(year, month, day)
+            end = datetime.fromordinal(start.toordinal() + 1)
+        elif month is not None:
+            start = datetime(year, month, 1)
+            end = datetime(year + month // 12, month % 12 + 1, 1)
+        else:
+            start = datetime(year, 1, 1)
+            end = datetime(year + 1, 1, 1)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    tz = timezone.get_current_timezone()
+    return timezone.make_aware(start, tz), timezone.make_aware(end, tz)
+
+
+def parse_period(value):
+    """
+    function to parse a user input like 2022, 2022-03, 03/2022, 2022-03-09
+    or 09/03/2022 into the datetime range it covers
+    :param value: string
+    :return: tuple of aware datetimes (start, end), end excluded, or None if
+    the input isn't a date
+    """
+    for date_format, precision in PERIOD_FORMATS:
+        try:
+            date = datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+        if precision == 'day':
+            return get_period(date.year, date.month, date.day)
+        elif precision == 'month':
+            return get_period(date.year, date.month)
+        return get_period(date.year)
+    return None
+
+
+class PeriodFilter(filters.CharFilter):
+    """
+    Filter keeping the objects whose date is in the period typed by the
+    user, with a range lookup instead of matching the date as text
+    """
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        period = parse_period(value)
+        if period is None:
+            return qs.none()
+        return qs.filter(**{self.field_name + '__gte': period[0],
+                            self.field_name + '__lt': period[1]})
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter adding id to the requested ordering, so rows with equal
+    values keep the same order from one page to the next
+    """
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering = list(ordering) + ['id']
+        return ordering
+
+
+class SyncFilterSet(filters.FilterSet):
+    """
+    Base FilterSet adding ?updated_since=, the objects saved since an ISO
+    8601 datetime, served by the (date_updated, id) indexes
+    """
+    updated_since = filters.IsoDateTimeFilter(field_name='date_updated',
+                                              lookup_expr='gte')
+
+
+class DateFilterSet(SyncFilterSet):
+    """
+    Base FilterSet adding ?year=&month=&day= filters on date_field, turned
+    into a single datetime range. month and day only refine a year.
+    """
+    date_field = None
+
+    year = filters.NumberFilter(method='filter_period')
+    month = filters.NumberFilter(method='filter_period')
+    day = filters.NumberFilter(method='filter_period')
+
+    def filter_period(self, queryset, name, value):
+        if name != 'year':
+            return queryset
+        data = self.form.cleaned_data
+        month = int(data['month']) if data.get('month') else None
+        day = int(data['day']) if data.get('day') and month else None
+        period = get_period(int(value), month, day)
+        if period is None:
+            return queryset.none()
+        return queryset.filter(**{self.date_field + '__gte': period[0],
+                                  self.date_field + '__lt': period[1]})
+
+
+class ContractFilter(DateFilterSet):
     """
     Filters for ContractViewset
     """
-    date_contains = filters.CharFilter(field_name='date_created',
-                                       lookup_expr='icontains')
+    date_field = 'date_created'
+
+    # date_after / date_before
+    date = filters.DateFromToRangeFilter(field_name='date_created')
+    # kept for compatibility, the input is turned into a range
+    date_contains = PeriodFilter(field_name='date_created')
 
     class Meta:
         model = Contract
@@ -20,12 +141,17 @@ class ContractFilter(filters.FilterSet):
         ]
 
 
-class EventFilter(filters.FilterSet):
+class EventFilter(DateFilterSet):
     """
     Filters for EventViewset
     """
-    date_contains = filters.CharFilter(field_name='event_date',
-                                       lookup_expr='icontains')
+    date_field = 'event_date'
+
+    # date_after / date_before
+    date = filters.DateFromToRangeFilter(field_name='event_date')
+    # kept for compatibility, the input is turned into a range
+    date_contains = PeriodFilter(field_name='event_date')
+
     class Meta:
         model = Event
         fields = [
@@ -37,7 +163,7 @@ class EventFilter(filters.FilterSet):
         ]
 
 
-class CustomerFilter(filters.FilterSet):
+class CustomerFilter(SyncFilterSet):
     """
     Filters for CustomerViewset
     """
@@ -48,4 +174,4 @@ class CustomerFilter(filters.FilterSet):
             'last_name',
             'company',
             'sale_contact'
-        ]
\ No newline at end of file
+        ]
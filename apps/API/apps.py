@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.API'
+
+    def ready(self):
+        from . import signals
+        from .search import install_search_indexes
+        post_migrate.connect(install_search_indexes, sender=self)
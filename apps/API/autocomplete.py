@@ -0,0 +1,159 @@
+from bisect import bisect_left, insort
+from threading import Lock
+from time import monotonic
+from django.conf import settings
+from .models import Customer
+import re
+
+
+# characters separating the words of a company or a name
+WORD_SEPARATORS = re.compile(r"[\s\-'&,.]+")
+
+
+class CustomerPrefixIndex:
+    """
+    In-process index of the customers company, last_name and email, kept as
+    a sorted list of (key, customer id) searched with bisect. The full
+    values and each word of company and last_name are indexed, so 'corp'
+    finds 'Acme Corp'.
+    The index is built on first use, updated by the Customer signals of
+    this process and rebuilt every ttl seconds to catch the changes made by
+    other processes or by queryset updates. A single request rebuilds a
+    stale index, the others keep searching the current one meanwhile.
+    """
+    fields = ('company', 'last_name', 'email')
+    word_fields = ('company', 'last_name')
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.lock = Lock()
+        # held by the request building the index
+        self.build_lock = Lock()
+        self.built_at = None
+        self.entries = []
+        self.keys = {}
+        self.customers = {}
+
+    def get_keys(self, customer):
+        """
+        :param customer: dict with the indexed fields
+        :return: set of the lowercase keys indexing a customer
+        """
+        keys = set()
+        for field in self.fields:
+            value = (customer[field] or '').lower().strip()
+            if not value:
+                continue
+            keys.add(value)
+            if field in self.word_fields:
+                keys.update(word for word in WORD_SEPARATORS.split(value)
+                            if word)
+        return keys
+
+    def build(self):
+        values = Customer.objects.values(
+            'id', 'company', 'first_name', 'last_name', 'email')
+        entries, keys, customers = [], {}, {}
+        for customer in values.iterator():
+            customer_keys = self.get_keys(customer)
+            entries.extend((key, customer['id']) for key in customer_keys)
+            keys[customer['id']] = customer_keys
+            customers[customer['id']] = customer
+        entries.sort()
+        with self.lock:
+            self.entries, self.keys, self.customers = entries, keys, customers
+            self.built_at = monotonic()
+
+    def refresh(self):
+        """
+        build the index when stale: the first build is waited for, a
+        rebuild is skipped while another request runs it
+        """
+        if self.built_at is None:
+            with self.build_lock:
+                if self.built_at is None:
+                    self.build()
+        elif self.build_lock.acquire(blocking=False):
+            try:
+                if self.is_stale():
+                    self.build()
+            finally:
+                self.build_lock.release()
+
+    def clear(self):
+        """
+        drop the index, it is built again on next search
+        """
+        with self.lock:
+            self.entries, self.keys, self.customers = [], {}, {}
+            self.built_at = None
+
+    def is_stale(self):
+        return self.built_at is None or (
+            self.ttl is not None and monotonic() - self.built_at > self.ttl)
+
+    def remove(self, customer_id):
+        with self.lock:
+            if self.built_at is None:
+                return
+            self._remove(customer_id)
+
+    def _remove(self, customer_id):
+        for key in self.keys.pop(customer_id, ()):
+            index = bisect_left(self.entries, (key, customer_id))
+            if index < len(self.entries) \
+                    and self.entries[index] == (key, customer_id):
+                del self.entries[index]
+        self.customers.pop(customer_id, None)
+
+    def update(self, instance):
+        """
+        index the new values of a customer, nothing is done before the
+        index is built
+        :param instance: Customer instance
+        """
+        customer = {
+            'id': instance.id,
+            'company': instance.company,
+            'first_name': instance.first_name,
+            'last_name': instance.last_name,
+            'email': instance.email,
+        }
+        with self.lock:
+            if self.built_at is None:
+                return
+            self._remove(instance.id)
+            customer_keys = self.get_keys(customer)
+            for key in customer_keys:
+                insort(self.entries, (key, instance.id))
+            self.keys[instance.id] = customer_keys
+            self.customers[instance.id] = customer
+
+    def search(self, text, limit=10):
+        """
+        get the customers having a key starting with text
+        :param text: prefix typed by the user
+        :param limit: int, maximum number of customers returned
+        :return: list of dict, ordered by matching key
+        """
+        prefix = text.lower().strip()
+        if not prefix:
+            return []
+        if self.is_stale():
+            self.refresh()
+        results, seen = [], set()
+        with self.lock:
+            index = bisect_left(self.entries, (prefix,))
+            while index < len(self.entries) and len(results) < limit:
+                key, customer_id = self.entries[index]
+                if not key.startswith(prefix):
+                    break
+                if customer_id not in seen:
+                    seen.add(customer_id)
+                    results.append(dict(self.customers[customer_id]))
+                index += 1
+        return results
+
+
+customer_prefix_index = CustomerPrefixIndex(
+    getattr(settings, 'AUTOCOMPLETE_INDEX_TTL', 300))
@@ -0,0 +1,273 @@
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from time import monotonic
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from urllib.parse import urlencode
+import hashlib
+import uuid
+
+
+class LRUCacheBackend:
+    """
+    Bounded in-process LRU cache, values are deep copied in and out so
+    callers can modify what they get
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get_many(self, keys):
+        now = monotonic()
+        values = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires is not None and expires < now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                values[key] = value
+        return deepcopy(values)
+
+    def set_many(self, mapping, timeout=None):
+        expires = monotonic() + timeout if timeout else None
+        mapping = deepcopy(mapping)
+        with self.lock:
+            for key, value in mapping.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Backend storing the entries in one of the CACHES, to share them between
+    processes. Keys hold key_prefix, a namespace version and the md5 of the
+    entry key, which can exceed the 250 characters memcached accepts. clear
+    gives a new namespace so only the entries of this backend are dropped,
+    left to the eviction of the cache server.
+    """
+    def __init__(self, alias='default', key_prefix='api'):
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+        self.namespace_key = f'{key_prefix}:namespace'
+
+    def get_namespace(self):
+        namespace = self.cache.get(self.namespace_key)
+        if namespace is None:
+            self.cache.add(self.namespace_key, uuid.uuid4().hex, None)
+            namespace = self.cache.get(self.namespace_key)
+        return namespace
+
+    def make_keys(self, keys):
+        """
+        :return: dict, cache key of each key
+        """
+        prefix = f'{self.key_prefix}:{self.get_namespace()}'
+        return {key: f'{prefix}:{hashlib.md5(key.encode()).hexdigest()}'
+                for key in keys}
+
+    def get_many(self, keys):
+        keys = {cache_key: key
+                for key, cache_key in self.make_keys(keys).items()}
+        values = self.cache.get_many(list(keys))
+        return {keys[key]: value for key, value in values.items()}
+
+    def set_many(self, mapping, timeout=None):
+        keys = self.make_keys(mapping)
+        self.cache.set_many({keys[key]: value
+                             for key, value in mapping.items()}, timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(list(self.make_keys(keys).values()))
+
+    def clear(self):
+        self.cache.set(self.namespace_key, uuid.uuid4().hex, None)
+
+
+def get_tag(model, pk):
+    """
+    :return: string, tag of an object
+    """
+    return f'tag:{model._meta.label_lower}:{pk}'
+
+
+def get_instance_tags(instance):
+    """
+    function to get the tags of an object and of the objects its foreign
+    keys point to, whose data can be embedded in its representation
+    :param instance: model instance
+    :return: set of tags
+    """
+    tags = {get_tag(type(instance), instance.pk)}
+    for field in instance._meta.concrete_fields:
+        if field.is_relation:
+            value = getattr(instance, field.attname)
+            if value is not None:
+                tags.add(get_tag(field.related_model, value))
+    return tags
+
+
+class TaggedCache:
+    """
+    Cache whose entries are invalidated by tag. An entry keeps the version
+    of each of its tags when stored and is a miss as soon as one of them
+    changed or was evicted. Invalidating a tag deletes its version.
+    Each invalidation also renews a generation, read before loading the
+    data to store: when it changed meanwhile the data may predate a write
+    and isn't stored.
+    """
+    generation_key = 'generation'
+
+    def __init__(self, backend, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+
+    def get(self, key):
+        entry = self.backend.get_many([key]).get(key)
+        if entry is None:
+            return None
+        versions, value = entry
+        if self.backend.get_many(list(versions)) != versions:
+            return None
+        return value
+
+    def get_generation(self):
+        """
+        to be called before loading the data passed to set
+        :return: string, current generation
+        """
+        generation = self.backend.get_many([self.generation_key]).get(
+            self.generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set_many({self.generation_key: generation})
+        return generation
+
+    def set(self, key, value, tags, generation):
+        """
+        store value under the current versions of tags, unless a tag was
+        invalidated since generation was read
+        :param generation: string from get_generation
+        """
+        versions = self.backend.get_many(list(tags))
+        missing = {tag: uuid.uuid4().hex for tag in tags
+                   if tag not in versions}
+        if missing:
+            self.backend.set_many(missing)
+            versions.update(missing)
+        # read after the versions: an invalidation deleting a tag before
+        # they were read renewed the generation first
+        current = self.backend.get_many([self.generation_key]).get(
+            self.generation_key)
+        if current != generation:
+            return
+        self.backend.set_many({key: (versions, value)}, self.timeout)
+
+    def invalidate(self, tags):
+        """
+        invalidate the entries holding tags, again once the current
+        transaction is committed so entries filled in between from the old
+        rows are dropped too
+        :param tags: iterable of tags
+        """
+        tags = list(tags)
+        self.expire(tags)
+        transaction.on_commit(lambda: self.expire(tags))
+
+    def expire(self, tags):
+        self.backend.set_many({self.generation_key: uuid.uuid4().hex})
+        self.backend.delete_many(tags)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def get_retrieve_cache():
+    """
+    function building the retrieve cache from API_RETRIEVE_CACHE
+    :return: TaggedCache, None when disabled
+    """
+    config = getattr(settings, 'API_RETRIEVE_CACHE', {})
+    if not config.get('BACKEND'):
+        return None
+    backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return TaggedCache(backend, config.get('TIMEOUT'))
+
+
+retrieve_cache = get_retrieve_cache()
+
+
+def get_retrieve_key(view, pk):
+    """
+    function to get the key of a retrieve response, varying with the model,
+    the pk, the serializer and the query parameters (?fields=, ?expand=)
+    :param view: viewset
+    :param pk: object pk from the url
+    :return: string
+    """
+    model = view.queryset.model
+    serializer = view.get_serializer_class()
+    query = urlencode(sorted(view.request.query_params.lists()), doseq=True)
+    return f'retrieve:{model._meta.label_lower}:{pk}:' \
+           f'{serializer.__module__}.{serializer.__name__}:{query}'
+
+
+# seconds a version is kept, bounding how long a process not sharing the
+# cache of the others uses outdated data
+VERSION_TIMEOUT = 300
+# version of the users data embedded in the API responses
+USERS_VERSION_KEY = 'api:users_version'
+# version of the (id, email) users choices of the front forms
+USER_CHOICES_VERSION_KEY = 'front:user_choices_version'
+
+
+def get_version(key):
+    """
+    function to get a version kept in the default cache, shared by the
+    processes when it is (memcached), a new one is set when missing or
+    expired
+    :param key: string, cache key of the version
+    :return: string
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_users_version():
+    """
+    function to get the version of the users data embedded in the API
+    responses. Users have no date_updated, so the list and retrieve
+    validators include it.
+    :return: string
+    """
+    return get_version(USERS_VERSION_KEY)
+
+
+def forget_users_versions():
+    """
+    function giving the embedded users data and the users choices a new
+    version
+    """
+    cache.delete_many([USERS_VERSION_KEY, USER_CHOICES_VERSION_KEY])
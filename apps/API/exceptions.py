@@ -0,0 +1,11 @@
+from rest_framework.exceptions import APIException
+from rest_framework import status
+
+
+class MultipleEventsError(APIException):
+    """
+    Error raised when several events are linked to the same contract
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'several events are linked to this contract'
+    default_code = 'multiple_events'
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from apps.API.autocomplete import customer_prefix_index
+from apps.API.models import Customer
+from P12_backend.benchmark import percentile
+from time import perf_counter
+
+
+class Command(BaseCommand):
+    """
+    Command comparing the customers autocomplete prefix index with an
+    istartswith query (ILIKE 'x%' on PostgreSQL)
+    """
+    help = 'Compare p50/p99 latency of the autocomplete index and the DB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('prefixes', nargs='*',
+                            help='prefixes searched, defaults to the first '
+                                 'letters of some companies')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        prefixes = options['prefixes'] or [
+            company[:length] for company in Customer.objects.order_by('?')
+            .values_list('company', flat=True)[:5]
+            for length in (1, 3) if company]
+        if not prefixes:
+            raise CommandError('No customer to search')
+
+        start = perf_counter()
+        customer_prefix_index.build()
+        self.stdout.write(f'index built in '
+                          f'{(perf_counter() - start) * 1000:.1f}ms, '
+                          f'{len(customer_prefix_index.entries)} keys')
+
+        limit = options['limit']
+        for prefix in prefixes:
+            index = self.measure(
+                lambda: customer_prefix_index.search(prefix, limit),
+                options['iterations'])
+            db = self.measure(
+                lambda: list(Customer.objects.filter(
+                    Q(company__istartswith=prefix)
+                    | Q(last_name__istartswith=prefix)
+                    | Q(email__istartswith=prefix))
+                    .values('id', 'company', 'first_name', 'last_name',
+                            'email')[:limit]),
+                options['iterations'])
+            for name, timings in (('index', index), ('db', db)):
+                self.stdout.write(
+                    f'{prefix!r:<12} {name:<6} '
+                    f'p50={percentile(timings, 50) * 1000:.2f}ms '
+                    f'p99={percentile(timings, 99) * 1000:.2f}ms')
+
+    def measure(self, search, iterations):
+        """
+        run a search several times
+        :param search: callable
+        :param iterations: int, number of runs
+        :return: sorted list of latencies in seconds
+        """
+        timings = []
+        for _ in range(iterations):
+            start = perf_counter()
+            search()
+            timings.append(perf_counter() - start)
+        return sorted(timings)
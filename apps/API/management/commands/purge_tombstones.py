@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.API.models import Tombstone
+
+
+class Command(BaseCommand):
+    """
+    Command removing the deletions older than SYNC_TOMBSTONE_DAYS, the sync
+    clients asking for them get a 410 and resync fully
+    """
+    help = 'Remove the tombstones older than SYNC_TOMBSTONE_DAYS days'
+
+    def handle(self, *args, **options):
+        limit = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        count, _ = Tombstone.objects.filter(date_deleted__lt=limit).delete()
+        self.stdout.write(f'{count} tombstones removed')
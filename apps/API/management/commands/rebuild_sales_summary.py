@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from apps.API.summary import rebuild_sales_summary
+
+
+class Command(BaseCommand):
+    """
+    Command recomputing the sales dashboard summaries from the contracts,
+    after changes made without the Contract signals (queryset update, raw
+    SQL, loaddata, deleted sales users)
+    """
+    help = 'Rebuild the sales dashboard summary tables from the contracts'
+
+    def handle(self, *args, **options):
+        summaries, dues = rebuild_sales_summary()
+        self.stdout.write(f'{summaries} sales summaries, '
+                          f'{dues} monthly due summaries rebuilt')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from apps.API.models import Customer
+from apps.API.rollups import refresh_closed_contract_rollups, \
+    refresh_customer_rollups
+
+
+class Command(BaseCommand):
+    """
+    Command recomputing the customers rollups: on the first day of each
+    month for the contracts which stopped being open, or for every customer
+    with --all after changes made without the signals
+    """
+    help = 'Refresh the customers rollups of the contracts closed last month'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='refresh the rollups of every customer')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            count = refresh_customer_rollups(
+                Customer.objects.values_list('id', flat=True))
+        else:
+            count = refresh_closed_contract_rollups()
+        self.stdout.write(f'{count} customers rollups refreshed')
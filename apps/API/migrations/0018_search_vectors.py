@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE "API_customer" ADD COLUMN "search_vector" tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple'::regconfig,
+        coalesce("first_name", '') || ' ' || coalesce("last_name", '')
+        || ' ' || coalesce("company", '') || ' ' || coalesce("email", '')
+        || ' ' || translate(coalesce("email", ''), '@.', '  '))) STORED
+    """,
+    'CREATE INDEX "customer_search_idx" ON "API_customer" '
+    'USING GIN ("search_vector")',
+    """
+    ALTER TABLE "API_event" ADD COLUMN "search_vector" tsvector
+    GENERATED ALWAYS AS (to_tsvector('french'::regconfig,
+        coalesce("note", ''))) STORED
+    """,
+    'CREATE INDEX "event_search_idx" ON "API_event" '
+    'USING GIN ("search_vector")',
+]
+
+POSTGRES_BACKWARD = [
+    'ALTER TABLE "API_customer" DROP COLUMN "search_vector"',
+    'ALTER TABLE "API_event" DROP COLUMN "search_vector"',
+]
+
+
+def add_search_vectors(apps, schema_editor):
+    """
+    the search vectors only exist on PostgreSQL, SQLite uses FTS5 tables
+    created after migrate by apps.API.search.install_search_indexes
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+def remove_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0017_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vectors, remove_search_vectors),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.1 on 2026-10-17 21:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('API', '0018_search_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contract_count', models.IntegerField(default=0)),
+                ('total_amount', models.BigIntegerField(default=0)),
+                ('signed_count', models.IntegerField(default=0)),
+                ('signed_amount', models.BigIntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('pending_amount', models.BigIntegerField(default=0)),
+                ('sale_contact', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sales_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesDueSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('contract_count', models.IntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0)),
+                ('sale_contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_due_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesduesummary',
+            constraint=models.UniqueConstraint(fields=('sale_contact', 'month'), name='sales_due_month_unique'),
+        ),
+    ]
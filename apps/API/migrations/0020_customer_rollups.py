@@ -0,0 +1,70 @@
+# Generated by Django 4.0.1 on 2026-10-17 21:28
+
+from datetime import date
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_customer_rollups(apps, schema_editor):
+    # the expressions of apps.API.rollups at the time of this migration
+    Customer = apps.get_model('API', 'Customer')
+    Contract = apps.get_model('API', 'Contract')
+    Event = apps.get_model('API', 'Event')
+    contracts = Contract.objects.filter(customer=OuterRef('pk')) \
+        .order_by().values('customer')
+    events = Event.objects.filter(customer=OuterRef('pk')).order_by()
+
+    def aggregate(queryset, expression):
+        return Coalesce(Subquery(
+            queryset.annotate(value=expression).values('value')[:1]), 0,
+            output_field=IntegerField())
+
+    # signed contracts whose payement_due month isn't over
+    open_contracts = contracts.filter(
+        status=True, payement_due__gte=date.today().replace(day=1))
+    Customer.objects.update(
+        contract_count=aggregate(contracts, Count('id')),
+        total_contract_amount=aggregate(contracts, Sum('amount')),
+        open_contract_amount=aggregate(open_contracts, Sum('amount')),
+        event_count=aggregate(events.values('customer'), Count('id')),
+        next_event_date=Subquery(
+            events.filter(event_status=True).order_by('event_date')
+            .values('event_date')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0019_sales_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='contract_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='event_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='next_event_date',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='open_contract_amount',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_contract_amount',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_customer_rollups,
+                             migrations.RunPython.noop),
+    ]
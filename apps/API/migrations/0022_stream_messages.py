@@ -0,0 +1,26 @@
+# Generated by Django 4.0.1 on 2026-10-17 21:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0021_sync_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topics', models.JSONField()),
+                ('frame', models.TextField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='streammessage',
+            index=models.Index(fields=['date_created'], name='stream_message_created_idx'),
+        ),
+    ]
@@ -17,10 +17,39 @@ class Customer(models.Model):
     sale_contact = models.ForeignKey(to=User, on_delete=models.SET_NULL,
                                      null=True)
     existing = models.BooleanField(default=False)
+    # rollups of the contracts and events, updated by their signals
+    contract_count = models.IntegerField(default=0, editable=False)
+    total_contract_amount = models.BigIntegerField(default=0, editable=False)
+    open_contract_amount = models.BigIntegerField(default=0, editable=False)
+    event_count = models.IntegerField(default=0, editable=False)
+    next_event_date = models.DateTimeField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'],
+                         name='customer_created_id_idx'),
+            models.Index(fields=['date_updated', 'id'],
+                         name='customer_updated_id_idx'),
+        ]
+
+    ROLLUP_FIELDS = ('contract_count', 'total_contract_amount',
+                     'open_contract_amount', 'event_count', 'next_event_date')
 
     def __str__(self):
         return f'{self.company}, {self.first_name} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        """
+        updates don't write the rollups, so a customer loaded before a
+        contract or event change can't overwrite them with stale values
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.ROLLUP_FIELDS]
+        super().save(*args, **kwargs)
+
 
 class Contract(models.Model):
     """
@@ -36,6 +65,14 @@ class Contract(models.Model):
     payement_due = models.DateField()
     event_created = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'],
+                         name='contract_created_id_idx'),
+            models.Index(fields=['date_updated', 'id'],
+                         name='contract_updated_id_idx'),
+        ]
+
     def __str__(self):
         return f'Contrat {self.id}, {self.customer.company}.'
 
@@ -57,5 +94,92 @@ class Event(models.Model):
     event_date = models.DateTimeField(default=date_created)
     note = models.CharField(max_length=1024)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['event_date', 'id'],
+                         name='event_date_id_idx'),
+            models.Index(fields=['date_updated', 'id'],
+                         name='event_updated_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.contract.customer.company}, le {self.event_date}'
+
+
+class SalesSummary(models.Model):
+    """
+    Contracts aggregates of a sale contact, kept up to date by the Contract
+    signals. Signed contracts have status True, pending ones status False.
+    """
+    sale_contact = models.OneToOneField(to=User, on_delete=models.CASCADE,
+                                        related_name='sales_summary')
+    contract_count = models.IntegerField(default=0)
+    total_amount = models.BigIntegerField(default=0)
+    signed_count = models.IntegerField(default=0)
+    signed_amount = models.BigIntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    pending_amount = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'Résumé des ventes de {self.sale_contact}'
+
+
+class SalesDueSummary(models.Model):
+    """
+    Amount of the signed contracts of a sale contact due each month, kept up
+    to date by the Contract signals
+    """
+    sale_contact = models.ForeignKey(to=User, on_delete=models.CASCADE,
+                                     related_name='sales_due_summaries')
+    # first day of the payement_due month
+    month = models.DateField()
+    contract_count = models.IntegerField(default=0)
+    amount = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sale_contact', 'month'],
+                                    name='sales_due_month_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.sale_contact}, {self.month:%m/%Y}'
+
+
+class Tombstone(models.Model):
+    """
+    Deleted customer, contract or event, recorded by the post_delete
+    signals (cascades included) so sync clients can fetch the deletions
+    """
+    # model_name of the deleted object: customer, contract or event
+    model_name = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    date_deleted = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_name', 'date_deleted', 'id'],
+                         name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.model_name} {self.object_id}, le {self.date_deleted}'
+
+
+class StreamMessage(models.Model):
+    """
+    Change notification written by the DatabaseBroker, read by the streams
+    of every process
+    """
+    topics = models.JSONField()
+    frame = models.TextField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created'],
+                         name='stream_message_created_idx'),
+        ]
+
     def __str__(self):
-        return f'{self.contract.customer.company}, le {self.event_date}'
\ No newline at end of file
+        return f'{self.frame.splitlines()[0]}, le {self.date_created}'
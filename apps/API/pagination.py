@@ -0,0 +1,224 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, \
+    LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, \
+    remove_query_param
+import json
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination filtering on the ordering fields values of the last
+    row seen, e.g. (date_created, id) > (value, id), so deep pages cost the
+    same as the first one and no count is run.
+    The ordering fields have to be ascending and unique together.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    max_limit = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.base_url = request.build_absolute_uri()
+        reverse, values = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by(*['-' + f for f in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if values is not None:
+            try:
+                queryset = queryset.filter(
+                    self.keyset_filter(values, reverse))
+            except (ValidationError, ValueError, TypeError):
+                # values of the wrong type for the ordering fields
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+
+    def keyset_filter(self, values, reverse):
+        """
+        build the filter selecting the rows after (or before) a position
+        :param values: list of the ordering fields values of the position
+        :param reverse: boolean, True to select the rows before
+        :return: Q object
+        """
+        lookup = '__lt' if reverse else '__gt'
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            condition |= Q(**equal, **{field + lookup: value})
+            equal[field] = value
+        return condition
+
+    def get_position(self, row):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(True, self.get_position(self.page[0]))
+
+    def encode_cursor(self, reverse, values):
+        data = json.dumps({'r': reverse, 'v': values}).encode()
+        cursor = urlsafe_b64encode(data).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   cursor)
+
+    def decode_cursor(self, request):
+        """
+        :return: tuple, reverse boolean and list of the ordering fields
+        values, or (False, None) without cursor
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return False, None
+        try:
+            data = json.loads(urlsafe_b64decode(cursor.encode()))
+            reverse, values = bool(data['r']), list(data['v'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, values
+
+
+class CountModePagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination where the count of the results can be exact,
+    estimated or skipped, chosen with ?count=exact|estimate|none or the
+    count_mode attribute of the view.
+    Without exact count, limit + 1 rows are fetched to know if there is a
+    next page.
+    """
+    count_query_param = 'count'
+    count_modes = ('exact', 'estimate', 'none')
+    default_count_mode = 'exact'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = self.get_count_mode(request, view)
+        self.view = view
+        if self.count_mode == 'exact':
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count_mode == 'estimate':
+            self.count = self.get_estimated_count(queryset)
+        else:
+            self.count = None
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_paginated_response(self, data):
+        if self.count_mode == 'exact':
+            return super().get_paginated_response(data)
+        response = OrderedDict()
+        if self.count_mode == 'estimate':
+            response['count'] = self.count
+            response['count_estimated'] = True
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_count(self, queryset):
+        """
+        count of the results, reusing the one the view already computed
+        with the list validators
+        """
+        count = getattr(self.view, 'result_count', None)
+        if count is not None:
+            return count
+        return super().get_count(queryset)
+
+    def get_count_mode(self, request, view):
+        mode = request.query_params.get(self.count_query_param)
+        if mode not in self.count_modes:
+            mode = getattr(view, 'count_mode', self.default_count_mode)
+        return mode
+
+    def get_estimated_count(self, queryset):
+        """
+        get the planner's row estimate of the table for unfiltered querysets
+        on PostgreSQL, the exact count otherwise
+        :param queryset: queryset paginated
+        :return: int
+        """
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where \
+                and not queryset.query.distinct:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            # reltuples is -1 (or 0) before the table is first analyzed
+            if row and row[0] > 0:
+                return int(row[0])
+        return self.get_count(queryset)
+
+    def get_next_link(self):
+        if self.count_mode == 'exact':
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        offset = self.offset + self.limit
+        return replace_query_param(url, self.offset_query_param, offset)
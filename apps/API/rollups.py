@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Contract, Customer, Event
+from .summary import get_month, get_open_contracts_filter
+
+
+def get_rollup_values(today=None):
+    """
+    function to get the expressions computing the rollup columns of a
+    customer from its contracts and events, with correlated subqueries
+    :param today: date the open contracts are selected at, today by default
+    :return: dict of expressions by Customer field name
+    """
+    contracts = Contract.objects.filter(customer=OuterRef('pk')) \
+        .order_by().values('customer')
+    events = Event.objects.filter(customer=OuterRef('pk')).order_by()
+
+    def aggregate(queryset, expression):
+        return Coalesce(Subquery(
+            queryset.annotate(value=expression).values('value')[:1]), 0,
+            output_field=IntegerField())
+
+    return {
+        'contract_count': aggregate(contracts, Count('id')),
+        'total_contract_amount': aggregate(contracts, Sum('amount')),
+        'open_contract_amount': aggregate(
+            contracts.filter(get_open_contracts_filter(today)),
+            Sum('amount')),
+        'event_count': aggregate(events.values('customer'), Count('id')),
+        # earliest event not finished
+        'next_event_date': Subquery(
+            events.filter(event_status=True).order_by('event_date')
+            .values('event_date')[:1]),
+    }
+
+
+def refresh_customer_rollups(customer_ids, today=None):
+    """
+    function recomputing the rollup columns of customers in one UPDATE,
+    run in the transaction of the contract or event change
+    :param customer_ids: iterable of customers pk, None values are ignored
+    :param today: date the open contracts are selected at, today by default
+    :return: int, number of customers updated
+    """
+    customer_ids = {id for id in customer_ids if id is not None}
+    if not customer_ids:
+        return 0
+    with transaction.atomic():
+        return Customer.objects.filter(id__in=customer_ids).update(
+            date_updated=timezone.now(), **get_rollup_values(today))
+
+
+def refresh_closed_contract_rollups(today=None):
+    """
+    function recomputing the rollups of the customers whose contracts
+    stopped being open at the start of the month, to run monthly
+    :param today: date, today by default
+    :return: int, number of customers updated
+    """
+    customer_ids = Contract.objects.filter(
+        status=True, payement_due__gte=get_month(today, -1),
+        payement_due__lt=get_month(today)) \
+        .values_list('customer_id', flat=True).distinct()
+    return refresh_customer_rollups(customer_ids, today)
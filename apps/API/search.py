@@ -0,0 +1,164 @@
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import Customer, Event
+import re
+
+
+# characters with a meaning in to_tsquery syntax
+TSQUERY_SPECIAL = re.compile(r"[&|!():*<>'\\]")
+# terms kept from the user input
+MAX_TERMS = 8
+
+
+class SearchIndex:
+    """
+    Full-text index of a table: a generated tsvector column
+    (search_vector) with a GIN index on PostgreSQL, an external content FTS5
+    table (<table>_fts) kept up to date by triggers on SQLite. Other
+    databases fall back to icontains lookups.
+    """
+    def __init__(self, model, columns, config):
+        self.model = model
+        self.columns = columns
+        self.config = config
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def fts_table(self):
+        return self.table + '_fts'
+
+    def get_terms(self, text):
+        """
+        :param text: user input
+        :return: list of the terms searched
+        """
+        return text.split()[:MAX_TERMS]
+
+    def get_postgres_query(self, terms):
+        """
+        build a to_tsquery expression matching every term as a prefix
+        :return: string, empty if no term is left
+        """
+        terms = [TSQUERY_SPECIAL.sub('', term) for term in terms]
+        return ' & '.join(term + ':*' for term in terms if term)
+
+    def get_sqlite_query(self, terms):
+        """
+        build a FTS5 query matching every term as a prefix
+        :return: string
+        """
+        return ' '.join('"' + term.replace('"', '""') + '"*'
+                        for term in terms)
+
+    def search(self, queryset, text, path=''):
+        """
+        filter a queryset on the objects matching the index, best ranked
+        first
+        :param queryset: queryset of the indexed model, or of a model
+        related to it through path
+        :param text: user input
+        :param path: foreign key from the queryset model to the indexed
+        model, '' for the indexed model itself
+        :return: queryset annotated with search_rank
+        """
+        terms = self.get_terms(text)
+        if not terms:
+            return queryset.none()
+        opts = queryset.model._meta
+        field = opts.get_field(path) if path else opts.pk
+        id_column = f'"{opts.db_table}"."{field.column}"'
+        vendor = connections[queryset.db].vendor
+
+        if vendor == 'postgresql':
+            query = self.get_postgres_query(terms)
+            if not query:
+                return queryset.none()
+            params = [self.config, query]
+            match = RawSQL(
+                f'SELECT id FROM "{self.table}" WHERE search_vector @@ '
+                f'to_tsquery(%s::regconfig, %s)', params)
+            rank = RawSQL(
+                f'SELECT ts_rank(search_vector, to_tsquery(%s::regconfig, '
+                f'%s)) FROM "{self.table}" WHERE id = {id_column}', params,
+                output_field=FloatField())
+        elif vendor == 'sqlite':
+            params = [self.get_sqlite_query(terms)]
+            match = RawSQL(
+                f'SELECT rowid FROM "{self.fts_table}" WHERE '
+                f'"{self.fts_table}" MATCH %s', params)
+            # bm25 is lower for better matches
+            rank = RawSQL(
+                f'SELECT -bm25("{self.fts_table}") FROM "{self.fts_table}" '
+                f'WHERE "{self.fts_table}" MATCH %s AND rowid = {id_column}',
+                params, output_field=FloatField())
+        else:
+            prefix = path + '__' if path else ''
+            for term in terms:
+                condition = Q()
+                for column in self.columns:
+                    condition |= Q(**{f'{prefix}{column}__icontains': term})
+                queryset = queryset.filter(condition)
+            return queryset.annotate(
+                search_rank=Value(0.0, output_field=FloatField()))
+
+        lookup = (path + '_id' if path else 'id') + '__in'
+        return queryset.filter(**{lookup: match}) \
+            .annotate(search_rank=rank).order_by('-search_rank', 'id')
+
+    def install_sqlite(self, cursor):
+        """
+        create the FTS5 table of the index and its triggers if missing, then
+        rebuild it from the indexed table. Run after each migrate because
+        SQLite migrations altering the indexed table recreate it, dropping
+        its triggers.
+        :param cursor: SQLite cursor
+        """
+        fts = self.fts_table
+        columns = ', '.join(self.columns)
+        new_values = ', '.join('new.' + column for column in self.columns)
+        old_values = ', '.join('old.' + column for column in self.columns)
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5('
+            f"{columns}, content='{self.table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')")
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_insert" AFTER INSERT ON '
+            f'"{self.table}" BEGIN INSERT INTO "{fts}"(rowid, {columns}) '
+            f'VALUES (new.id, {new_values}); END')
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_delete" AFTER DELETE ON '
+            f'"{self.table}" BEGIN INSERT INTO "{fts}"("{fts}", rowid, '
+            f"{columns}) VALUES ('delete', old.id, {old_values}); END")
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_update" AFTER UPDATE ON '
+            f'"{self.table}" BEGIN INSERT INTO "{fts}"("{fts}", rowid, '
+            f"{columns}) VALUES ('delete', old.id, {old_values}); "
+            f'INSERT INTO "{fts}"(rowid, {columns}) '
+            f'VALUES (new.id, {new_values}); END')
+        cursor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+
+customer_index = SearchIndex(
+    Customer, ('first_name', 'last_name', 'company', 'email'), 'simple')
+event_index = SearchIndex(Event, ('note',), 'french')
+
+SEARCH_INDEXES = (customer_index, event_index)
+
+
+def install_search_indexes(sender, using='default', **kwargs):
+    """
+    post_migrate receiver creating the FTS5 tables on SQLite, the
+    PostgreSQL search vectors are created by migration
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        for index in SEARCH_INDEXES:
+            if index.table in tables:
+                index.install_sqlite(cursor)
@@ -1,14 +1,103 @@
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
+from rest_framework.serializers import ModelSerializer, \
+    SerializerMethodField, ReadOnlyField, ValidationError, IntegerField
 from rest_framework.validators import UniqueTogetherValidator
-from apps.API.models import Customer, Contract, Event
+from django.db.models import Prefetch
+from apps.API.models import Customer, Contract, Event, SalesSummary, \
+    Tombstone
+from apps.API.exceptions import MultipleEventsError
 from apps.authenticate.serializers import EmbedCustomUserSerializer, \
     DetailCustomUserSerializer
 
 
+def get_related_fields(serializer_class, attribute):
+    """
+    function to collect the relations declared by a serializer and its
+    mixins, in select_related_fields, prefetch_related_fields or
+    expandable_fields. Declarations are either a tuple of names, used as
+    both field name and lookup, or a dict of field name: lookup
+    :param serializer_class: serializer class
+    :param attribute: string, name of the declaring attribute
+    :return: list of (field name, lookup) tuples
+    """
+    fields = []
+    seen = set()
+    for klass in serializer_class.__mro__:
+        declared = klass.__dict__.get(attribute, ())
+        if isinstance(declared, dict):
+            items = declared.items()
+        else:
+            items = [(name, name) for name in declared]
+        for field, lookup in items:
+            if field not in seen:
+                seen.add(field)
+                fields.append((field, lookup))
+    return fields
+
+
+def get_query_list(request, param):
+    """
+    function to read a comma separated query parameter
+    :param request: API request
+    :param param: string, parameter name
+    :return: set of values, None if the parameter is absent
+    """
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def get_requested_fields(serializer_class, request):
+    """
+    function to get the fields and expansions requested with ?fields= and
+    ?expand= for a serializer handling them
+    :param serializer_class: serializer class
+    :param request: API request
+    :return: tuple of sets of field names, None when not requested
+    """
+    if request is None or not issubclass(serializer_class,
+                                         DynamicFieldsMixin):
+        return None, None
+    return get_query_list(request, 'fields'), get_query_list(request, 'expand')
+
+
+class DynamicFieldsMixin:
+    """
+    Mixin handling the ?fields= and ?expand= query parameters.
+    fields keeps only the listed fields. When expand is given, the nested
+    objects declared in expandable_fields are only embedded if listed, and
+    replaced by their id otherwise. Without expand, the default
+    representation is kept.
+    expandable_fields maps a field name to the attribute holding its id,
+    or to None to use a get_<field>_id method.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        fields, expand = get_requested_fields(type(self), request)
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+        if expand is not None:
+            expandable = get_related_fields(type(self), 'expandable_fields')
+            for name, source in expandable:
+                if name in self.fields and name not in expand:
+                    if source is None:
+                        self.fields[name] = SerializerMethodField(
+                            method_name=f'get_{name}_id')
+                    else:
+                        self.fields[name] = ReadOnlyField(source=source)
+
+
 class ContractMixin:
     """
     Mixin that get contract data with serializer method fields
     """
+    select_related_fields = ('contract',)
+    expandable_fields = {'contract': 'contract_id'}
+
     def get_contract(self, instance):
         sale = instance.contract
         serializer = EmbedContractSerializer(sale)
@@ -19,6 +108,9 @@ class SaleMixin:
     """
     Mixin that get sale_contact data wit serilazer method fields
     """
+    select_related_fields = ('sale_contact',)
+    expandable_fields = {'sale_contact': 'sale_contact_id'}
+
     def get_sale_contact(self, instance):
         sale = instance.sale_contact
         serializer = EmbedCustomUserSerializer(sale)
@@ -29,12 +121,28 @@ class CustomerMixin:
     """
     Mixin that get customer data with serializer method fields
     """
+    select_related_fields = ('customer',)
+    expandable_fields = {'customer': 'customer_id'}
+
     def get_customer(self, instance):
         customer = instance.customer
         serializer = EmbeddedCustomerSerializer(customer)
         return serializer.data
 
 
+class ContractEventMixin:
+    """
+    Mixin that validate a contract is linked to one event at most
+    """
+    def validate_contract(self, contract):
+        events = Event.objects.filter(contract=contract)
+        if self.instance is not None:
+            events = events.exclude(id=self.instance.id)
+        if contract is not None and events.exists():
+            raise ValidationError('an event already exists for this contract')
+        return contract
+
+
 class CreateCustomerSerializer(ModelSerializer):
     """
     Serializer that handle Customer creation
@@ -72,7 +180,8 @@ class CreateCustomerSerializer(ModelSerializer):
         return Customer.objects.create(**validated_data)
 
 
-class ListCustomersSerializer(SaleMixin, ModelSerializer):
+class ListCustomersSerializer(DynamicFieldsMixin, SaleMixin,
+                              ModelSerializer):
     """
     Serializer for customers list display
     """
@@ -85,7 +194,8 @@ class ListCustomersSerializer(SaleMixin, ModelSerializer):
             'existing')
 
 
-class DetailCustomersSerializer(SaleMixin, ModelSerializer):
+class DetailCustomersSerializer(DynamicFieldsMixin, SaleMixin,
+                                ModelSerializer):
     """
     serilaizer for detail customer display
     """
@@ -124,7 +234,7 @@ class CreateContractSerializer(ModelSerializer):
 
 
 
-class ListContractSerializer(SaleMixin, ModelSerializer,
+class ListContractSerializer(DynamicFieldsMixin, SaleMixin, ModelSerializer,
                              CustomerMixin):
     """
     serializer for contract list display
@@ -138,10 +248,17 @@ class ListContractSerializer(SaleMixin, ModelSerializer,
             'id', 'customer', 'status', 'amount', 'sale_contact')
 
 
-class DetailContractSerializer(SaleMixin, ModelSerializer, CustomerMixin):
+class DetailContractSerializer(DynamicFieldsMixin, SaleMixin, ModelSerializer,
+                               CustomerMixin):
     """
     serializer for contract details display
     """
+    prefetch_related_fields = {
+        'event': Prefetch('event_set', queryset=Event.objects.order_by('id'),
+                          to_attr='contract_events')
+    }
+    expandable_fields = {'event': None}
+
     sale_contact = SerializerMethodField()
     customer = SerializerMethodField()
     event = SerializerMethodField()
@@ -153,12 +270,25 @@ class DetailContractSerializer(SaleMixin, ModelSerializer, CustomerMixin):
                   'payement_due', 'event')
 
     def get_event(self, instance):
-        try:
-            event = Event.objects.get(contract_id=instance.id)
-            serializer = EmbedEventSerializer(event)
-            return serializer.data
-        except:
+        event = self.get_contract_event(instance)
+        if event is None:
             return None
+        serializer = EmbedEventSerializer(event)
+        return serializer.data
+
+    def get_event_id(self, instance):
+        event = self.get_contract_event(instance)
+        return event.id if event is not None else None
+
+    def get_contract_event(self, instance):
+        if hasattr(instance, 'contract_events'):
+            events = instance.contract_events
+        else:
+            events = list(instance.event_set.all()[:2])
+        if len(events) > 1:
+            raise MultipleEventsError(
+                f'several events are linked to contract {instance.id}')
+        return events[0] if events else None
 
 
 class EmbedContractSerializer(ModelSerializer):
@@ -179,7 +309,7 @@ class EditContractSerializer(ModelSerializer):
         fields = '__all__'
 
 
-class CreateEventSerializer(ModelSerializer):
+class CreateEventSerializer(ContractEventMixin, ModelSerializer):
     """
     serializer for event creation
     """
@@ -190,10 +320,13 @@ class CreateEventSerializer(ModelSerializer):
         'event_date', 'note', 'contract')
 
 
-class ListEventSerializer(ModelSerializer, CustomerMixin):
+class ListEventSerializer(DynamicFieldsMixin, ModelSerializer, CustomerMixin):
     """
     serializer for events list display
     """
+    select_related_fields = ('support_contact',)
+    expandable_fields = {'support_contact': 'support_contact_id'}
+
     support_contact = SerializerMethodField()
     customer = SerializerMethodField()
 
@@ -209,10 +342,26 @@ class ListEventSerializer(ModelSerializer, CustomerMixin):
         return serializer.data
 
 
-class DetailEventSerializer(ModelSerializer, CustomerMixin, ContractMixin):
+class CalendarEventSerializer(ListEventSerializer, ContractMixin):
+    """
+    serializer for the events of the calendar
+    """
+    contract = SerializerMethodField()
+
+    class Meta(ListEventSerializer.Meta):
+        fields = (
+            'id', 'event_date', 'event_status', 'attendees', 'customer',
+            'contract', 'support_contact')
+
+
+class DetailEventSerializer(DynamicFieldsMixin, ModelSerializer, CustomerMixin,
+                            ContractMixin):
     """
     serializer for detail event view
     """
+    select_related_fields = ('support_contact',)
+    expandable_fields = {'support_contact': 'support_contact_id'}
+
     support_contact = SerializerMethodField()
     customer = SerializerMethodField()
     contract = SerializerMethodField()
@@ -236,10 +385,43 @@ class EmbedEventSerializer(ModelSerializer):
         fields = ['id']
 
 
-class EditEventSerializer(ModelSerializer):
+class EditEventSerializer(ContractEventMixin, ModelSerializer):
     """
     serializer for editing event
     """
     class Meta:
         model = Event
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class SalesSummarySerializer(SaleMixin, ModelSerializer):
+    """
+    serializer for the sales dashboard, open_amount and upcoming_dues are
+    set on the instances by the view
+    """
+    sale_contact = SerializerMethodField()
+    open_amount = SerializerMethodField()
+    payement_due = SerializerMethodField()
+
+    class Meta:
+        model = SalesSummary
+        fields = ('sale_contact', 'contract_count', 'total_amount',
+                  'open_amount', 'signed_count', 'signed_amount',
+                  'pending_count', 'pending_amount', 'payement_due')
+
+    def get_open_amount(self, instance):
+        return getattr(instance, 'open_amount', 0)
+
+    def get_payement_due(self, instance):
+        return getattr(instance, 'upcoming_dues', [])
+
+
+class TombstoneSerializer(ModelSerializer):
+    """
+    Serializer for the deletions feed
+    """
+    id = IntegerField(source='object_id')
+
+    class Meta:
+        model = Tombstone
+        fields = ('id', 'date_deleted')
@@ -0,0 +1,221 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from apps.authenticate.serializers import DetailCustomUserSerializer, \
+    EmbedCustomUserSerializer
+from .autocomplete import customer_prefix_index
+from .cache import forget_users_versions, get_tag, retrieve_cache
+from .models import Contract, Customer, Event, Tombstone, User
+from .rollups import refresh_customer_rollups
+from .stream import RECIPIENT_FIELDS, publish_change
+from .summary import SUMMARY_FIELDS, contract_changed, get_contract_values
+
+
+# fields of contracts and events counted in the customer rollups
+CONTRACT_ROLLUP_FIELDS = ('customer_id', 'amount', 'status',
+                          'payement_due')
+EVENT_ROLLUP_FIELDS = ('customer_id', 'event_status', 'event_date')
+
+# user fields embedded in the customers, contracts and events data
+EMBEDDED_USER_FIELDS = set(DetailCustomUserSerializer.Meta.fields) \
+    | set(EmbedCustomUserSerializer.Meta.fields)
+# user fields shown in or selecting the users choices of the front forms
+CHOICES_USER_FIELDS = {'email', 'role', 'is_superuser'}
+
+# objects whose cached representation or rollups depend on a model
+CACHE_PARENTS = {
+    Contract: ('customer',),
+    Event: ('customer', 'contract'),
+}
+
+
+def rollup_changed(instance, old_values, fields):
+    """
+    :return: boolean, True if the instance is new or one of fields changed
+    """
+    if old_values is None:
+        return True
+    return any(old_values[field] != getattr(instance, field)
+               for field in fields)
+
+
+def invalidate_cache(instance, old_values=None):
+    """
+    invalidate the cached representations of an object and of its parents,
+    the previous ones too when it moved
+    :param instance: model instance saved or deleted
+    :param old_values: dict of the stored values before the save, by attname
+    """
+    if retrieve_cache is None:
+        return
+    tags = {get_tag(type(instance), instance.pk)}
+    for name in CACHE_PARENTS.get(type(instance), ()):
+        field = instance._meta.get_field(name)
+        values = [getattr(instance, field.attname)]
+        if old_values:
+            values.append(old_values.get(field.attname))
+        tags.update(get_tag(field.related_model, value)
+                    for value in values if value is not None)
+    retrieve_cache.invalidate(tags)
+
+
+@receiver(post_save, sender=Customer)
+def customer_saved(sender, instance, **kwargs):
+    """
+    index the customer values once the transaction is committed
+    """
+    invalidate_cache(instance)
+    transaction.on_commit(lambda: customer_prefix_index.update(instance))
+
+
+@receiver(post_delete, sender=Customer)
+def customer_deleted(sender, instance, **kwargs):
+    invalidate_cache(instance)
+    customer_id = instance.id
+    transaction.on_commit(lambda: customer_prefix_index.remove(customer_id))
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+def record_deletion(sender, instance, **kwargs):
+    """
+    record the deleted object for the sync clients, the contracts and
+    events deleted in cascade send post_delete too
+    """
+    Tombstone.objects.create(model_name=instance._meta.model_name,
+                             object_id=instance.pk)
+
+
+@receiver(pre_save, sender=Customer)
+def customer_saving(sender, instance, raw, **kwargs):
+    """
+    keep the stored sale contact of an updated customer for the streams
+    """
+    if raw or instance.pk is None:
+        instance._previous_recipient_id = None
+        return
+    instance._previous_recipient_id = Customer.objects \
+        .filter(pk=instance.pk).values_list('sale_contact_id', flat=True) \
+        .first()
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+def publish_saved(sender, instance, created, raw, **kwargs):
+    """
+    notify the streams of the saved object, and the previous contact kept
+    by the pre_save receivers
+    """
+    if not raw:
+        publish_change(instance, 'created' if created else 'updated',
+                       getattr(instance, '_previous_recipient_id', None))
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+def publish_deleted(sender, instance, **kwargs):
+    """
+    notify the streams of the deleted object
+    """
+    publish_change(instance, 'deleted')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    invalidate the cached objects and validators embedding the user and the
+    users choices of the front forms, unless only other fields were saved
+    (e.g. last_login on each login)
+    """
+    if update_fields is not None and not (
+            EMBEDDED_USER_FIELDS | CHOICES_USER_FIELDS) & set(update_fields):
+        return
+    invalidate_cache(instance)
+    forget_users_versions()
+    transaction.on_commit(forget_users_versions)
+
+
+@receiver(pre_save, sender=Contract)
+def contract_saving(sender, instance, raw, **kwargs):
+    """
+    keep the stored values of an updated contract, to move its amount
+    between the sales summaries and customer rollups once saved
+    """
+    instance._summary_values = None
+    instance._rollup_values = None
+    instance._previous_recipient_id = None
+    if raw or instance.pk is None:
+        return
+    values = Contract.objects.filter(pk=instance.pk) \
+        .values(*SUMMARY_FIELDS, 'customer_id').first()
+    if values is None:
+        return
+    instance._previous_recipient_id = values[RECIPIENT_FIELDS['contract']]
+    instance._rollup_values = {field: values[field]
+                               for field in CONTRACT_ROLLUP_FIELDS}
+    instance._summary_values = {field: values[field]
+                                for field in SUMMARY_FIELDS}
+
+
+@receiver(post_save, sender=Contract)
+def contract_saved(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    contract_changed(getattr(instance, '_summary_values', None),
+                     get_contract_values(instance))
+    old_values = getattr(instance, '_rollup_values', None)
+    invalidate_cache(instance, old_values)
+    if rollup_changed(instance, old_values, CONTRACT_ROLLUP_FIELDS):
+        refresh_customer_rollups([
+            instance.customer_id,
+            old_values and old_values['customer_id']])
+
+
+@receiver(post_delete, sender=Contract)
+def contract_deleted(sender, instance, **kwargs):
+    contract_changed(get_contract_values(instance), None)
+    invalidate_cache(instance)
+    refresh_customer_rollups([instance.customer_id])
+
+
+@receiver(pre_save, sender=Event)
+def event_saving(sender, instance, raw, **kwargs):
+    """
+    keep the stored values of an updated event for the customer rollups
+    and the streams
+    """
+    instance._rollup_values = None
+    instance._previous_recipient_id = None
+    if raw or instance.pk is None:
+        return
+    recipient_field = RECIPIENT_FIELDS['event']
+    values = Event.objects.filter(pk=instance.pk) \
+        .values(*EVENT_ROLLUP_FIELDS, 'contract_id', recipient_field).first()
+    instance._rollup_values = values
+    if values is not None:
+        instance._previous_recipient_id = values[recipient_field]
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    old_values = getattr(instance, '_rollup_values', None)
+    invalidate_cache(instance, old_values)
+    # a move to another contract refreshes the rollups too, so the customer
+    # date_updated validating the contracts embedding the event changes
+    if rollup_changed(instance, old_values,
+                      EVENT_ROLLUP_FIELDS + ('contract_id',)):
+        refresh_customer_rollups([
+            instance.customer_id,
+            old_values and old_values['customer_id']])
+
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    invalidate_cache(instance)
+    refresh_customer_rollups([instance.customer_id])
@@ -0,0 +1,394 @@
+from collections import defaultdict
+from datetime import timedelta
+from threading import Lock, Thread
+from time import monotonic, sleep
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Max, Q
+from django.http.cookie import parse_cookie
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .models import StreamMessage
+import asyncio
+import json
+
+
+# topic of the changes every manager receives
+MANAGERS_TOPIC = 'managers'
+# field of each model holding the user notified of its changes
+RECIPIENT_FIELDS = {
+    'customer': 'sale_contact_id',
+    'contract': 'sale_contact_id',
+    'event': 'support_contact_id',
+}
+
+
+def get_user_topic(user_id):
+    """
+    :return: string, topic of the changes notified to a user
+    """
+    return f'user:{user_id}'
+
+
+def encode_event(name, data):
+    """
+    function to encode a Server-Sent Event
+    :param name: string, event type
+    :param data: JSON serializable data
+    :return: bytes
+    """
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+class Subscription:
+    """
+    Stream subscribed to topics, whose frames are queued in the event loop
+    of the connection. A subscriber too slow to read its queue is marked
+    overflowed and disconnected, it resyncs with ?updated_since=.
+    """
+    def __init__(self, topics, queue_size):
+        self.topics = topics
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def push(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """
+    In-process pub/sub: subscriptions are indexed by topic, so a change is
+    only handed to the streams of its recipients, whatever the number of
+    idle connections. publish can be called from any thread, frames are
+    queued in each subscriber's event loop with call_soon_threadsafe.
+    With several processes a stream only gets the changes made by its own
+    process, use DatabaseBroker then.
+    """
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscriptions = defaultdict(set)
+        self.lock = Lock()
+
+    def subscribe(self, topics):
+        """
+        must be called from the event loop of the connection
+        :param topics: list of topics
+        :return: Subscription
+        """
+        subscription = Subscription(topics, self.queue_size)
+        with self.lock:
+            for topic in topics:
+                self.subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.subscriptions.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[topic]
+
+    def publish(self, topics, frame):
+        """
+        send a frame to the subscribers of topics, once to each of them
+        :param topics: iterable of topics
+        :param frame: bytes from encode_event
+        """
+        with self.lock:
+            subscriptions = set()
+            for topic in topics:
+                subscriptions.update(self.subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push,
+                                                       frame)
+            except RuntimeError:
+                # the connection's event loop is closed
+                self.unsubscribe(subscription)
+
+
+class DatabaseBroker(LocalBroker):
+    """
+    Broker sharing the changes between processes through the StreamMessage
+    table: publish inserts a row, and a thread of each process having
+    streams polls the new rows every interval seconds to hand them to its
+    local subscribers. Ids skipped by transactions not yet committed are
+    read again for lookback seconds. Rows older than retention seconds are
+    deleted by the publishing and the polling processes, so the table stays
+    bounded even when no process streams.
+    Opt-in with API_STREAM['BROKER'], as every change then costs an INSERT.
+    """
+    # larger id gaps are sequence jumps, not transactions in progress
+    max_gap = 100
+
+    def __init__(self, queue_size=100, interval=1, lookback=30,
+                 retention=300):
+        super().__init__(queue_size)
+        self.interval = interval
+        self.lookback = lookback
+        self.retention = retention
+        self.last_id = None
+        # id skipped: monotonic time until which it is read again
+        self.pending = {}
+        self.pruned_at = monotonic()
+        self.poller = None
+        self.poller_lock = Lock()
+
+    def subscribe(self, topics):
+        subscription = super().subscribe(topics)
+        with self.poller_lock:
+            if self.poller is None:
+                self.poller = Thread(target=self.run, daemon=True,
+                                     name='stream-broker')
+                self.poller.start()
+        return subscription
+
+    def publish(self, topics, frame):
+        StreamMessage.objects.create(topics=list(topics),
+                                     frame=frame.decode())
+        self.prune()
+
+    def prune(self):
+        """
+        delete the rows older than retention seconds, at most once per
+        retention seconds in a process
+        """
+        now = monotonic()
+        if now - self.pruned_at <= self.retention:
+            return
+        self.pruned_at = now
+        StreamMessage.objects.filter(
+            date_created__lt=timezone.now()
+            - timedelta(seconds=self.retention)).delete()
+
+    def run(self):
+        while True:
+            if self.subscriptions or self.last_id is None:
+                try:
+                    self.poll()
+                except DatabaseError:
+                    # polled again after interval
+                    pass
+                finally:
+                    close_old_connections()
+            sleep(self.interval)
+
+    def poll(self):
+        """
+        hand the rows committed since the previous poll to the local
+        subscribers, the first poll only reads the last id
+        :return: int, number of rows handed
+        """
+        if self.last_id is None:
+            self.last_id = StreamMessage.objects.aggregate(
+                last_id=Max('id'))['last_id'] or 0
+            return 0
+        now = monotonic()
+        self.pending = {message_id: deadline
+                        for message_id, deadline in self.pending.items()
+                        if deadline > now}
+        rows = StreamMessage.objects.filter(
+            Q(id__gt=self.last_id) | Q(id__in=list(self.pending))) \
+            .order_by('id').values_list('id', 'topics', 'frame')
+        count = 0
+        for message_id, topics, frame in rows:
+            if message_id > self.last_id:
+                if message_id - self.last_id <= self.max_gap:
+                    self.pending.update(
+                        (skipped, now + self.lookback)
+                        for skipped in range(self.last_id + 1, message_id))
+                self.last_id = message_id
+            else:
+                self.pending.pop(message_id, None)
+            super().publish(topics, frame.encode())
+            count += 1
+        self.prune()
+        return count
+
+
+def get_broker():
+    """
+    function building the broker from API_STREAM
+    :return: broker instance
+    """
+    config = getattr(settings, 'API_STREAM', {})
+    broker_class = import_string(
+        config.get('BROKER', 'apps.API.stream.LocalBroker'))
+    return broker_class(**config.get('OPTIONS', {}))
+
+
+broker = get_broker()
+
+
+def publish_change(instance, action, previous_recipient_id=None):
+    """
+    notify the recipients of a customer, contract or event change once the
+    transaction is committed, the previous contact too when it was
+    reassigned so its view can drop the object
+    :param instance: model instance
+    :param action: string, created, updated or deleted
+    :param previous_recipient_id: user id of the contact before the save
+    """
+    model_name = instance._meta.model_name
+    topics = [MANAGERS_TOPIC]
+    recipient_ids = {getattr(instance, RECIPIENT_FIELDS[model_name]),
+                     previous_recipient_id}
+    topics.extend(get_user_topic(recipient_id)
+                  for recipient_id in recipient_ids
+                  if recipient_id is not None)
+    frame = encode_event(model_name, {
+        'action': action,
+        'id': instance.pk,
+        'date': timezone.now().isoformat(),
+    })
+    transaction.on_commit(lambda: broker.publish(topics, frame))
+
+
+def get_raw_token(scope):
+    """
+    function to get the access token of a connection, from the
+    Authorization header or the access cookie set by the front app
+    :param scope: ASGI scope
+    :return: string, None without token
+    """
+    headers = dict(scope.get('headers', ()))
+    authorization = headers.get(b'authorization', b'').decode('latin1')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):].strip()
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin1'))
+    return cookies.get('access')
+
+
+def get_stream_topics(raw_token):
+    """
+    function authenticating a token with the API authentication class and
+    getting the topics its user receives
+    :param raw_token: string
+    :return: list of topics, None if the token is refused
+    """
+    authentication = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+    try:
+        user = authentication.get_user(
+            authentication.get_validated_token(raw_token))
+        topics = [get_user_topic(user.id)]
+        if user.is_manager():
+            topics.append(MANAGERS_TOPIC)
+        return topics
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    finally:
+        close_old_connections()
+
+
+class EventStream:
+    """
+    ASGI application streaming the customers, contracts and events changes
+    of the authenticated user as Server-Sent Events: the changes of the
+    objects whose sale_contact or support_contact is the user, all of them
+    for managers. A comment is sent every keepalive seconds so proxies keep
+    idle connections open, and the stream ends after max_duration seconds
+    so the token is checked again on reconnection.
+    """
+    def __init__(self, broker, keepalive=15, max_duration=3600):
+        self.broker = broker
+        self.keepalive = keepalive
+        self.max_duration = max_duration
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            await self.send_error(send, 405, 'Method not allowed.')
+            return
+        raw_token = get_raw_token(scope)
+        topics = None
+        if raw_token:
+            topics = await sync_to_async(
+                get_stream_topics, thread_sensitive=False)(raw_token)
+        if topics is None:
+            await self.send_error(
+                send, 401, 'Authentication credentials were not provided '
+                           'or are not valid.')
+            return
+
+        subscription = self.broker.subscribe(topics)
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            # changes made before this date are fetched with ?updated_since=
+            await self.send_frame(send, encode_event(
+                'ready', {'date': timezone.now().isoformat()}))
+            await self.stream(subscription, disconnect, send)
+        finally:
+            self.broker.unsubscribe(subscription)
+            disconnect.cancel()
+
+    async def stream(self, subscription, disconnect, send):
+        end = monotonic() + self.max_duration
+        frame = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                timeout = min(self.keepalive, end - monotonic())
+                if timeout <= 0:
+                    break
+                done, _ = await asyncio.wait(
+                    {frame, disconnect}, timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    return
+                if frame not in done:
+                    await self.send_frame(send, b': keepalive\n\n')
+                    continue
+                await self.send_frame(send, frame.result())
+                if subscription.overflowed:
+                    await self.send_frame(send, encode_event(
+                        'overflow', {'date': timezone.now().isoformat()}))
+                    break
+                frame = asyncio.ensure_future(subscription.get())
+        finally:
+            frame.cancel()
+        await send({'type': 'http.response.body', 'body': b'',
+                    'more_body': False})
+
+    async def wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def send_frame(self, send, frame):
+        await send({'type': 'http.response.body', 'body': frame,
+                    'more_body': True})
+
+    async def send_error(self, send, status, detail):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body',
+                    'body': json.dumps({'detail': detail}).encode()})
+
+
+stream_application = EventStream(
+    broker, getattr(settings, 'API_STREAM', {}).get('KEEPALIVE', 15),
+    getattr(settings, 'API_STREAM', {}).get('MAX_DURATION', 3600))
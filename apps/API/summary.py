@@ -0,0 +1,148 @@
+from datetime import date
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from .models import Contract, SalesDueSummary, SalesSummary
+
+
+SUMMARY_FIELDS = ('sale_contact_id', 'amount', 'status', 'payement_due')
+
+
+def get_contract_values(contract):
+    """
+    function to get the values of a contract counted by the summaries, as
+    python values whatever was assigned to the instance
+    :param contract: Contract instance
+    :return: dict
+    """
+    return {
+        name: Contract._meta.get_field(name).to_python(getattr(contract, name))
+        for name in SUMMARY_FIELDS
+    }
+
+
+def get_or_create_row(model, **lookup):
+    """
+    get_or_create ignoring the race between two first contracts
+    """
+    try:
+        with transaction.atomic():
+            model.objects.get_or_create(**lookup)
+    except IntegrityError:
+        pass
+
+
+def count_contract(values, sign):
+    """
+    function adding (sign=1) or removing (sign=-1) a contract from the
+    summaries of its sale contact, with F() updates so concurrent saves
+    don't lose counts
+    :param values: dict from get_contract_values
+    :param sign: int, 1 or -1
+    """
+    sale_contact_id = values['sale_contact_id']
+    if sale_contact_id is None:
+        return
+    amount = sign * values['amount']
+    signed = values['status']
+
+    get_or_create_row(SalesSummary, sale_contact_id=sale_contact_id)
+    status_prefix = 'signed' if signed else 'pending'
+    SalesSummary.objects.filter(sale_contact_id=sale_contact_id).update(**{
+        'contract_count': F('contract_count') + sign,
+        'total_amount': F('total_amount') + amount,
+        status_prefix + '_count': F(status_prefix + '_count') + sign,
+        status_prefix + '_amount': F(status_prefix + '_amount') + amount,
+    })
+
+    if signed and values['payement_due'] is not None:
+        month = values['payement_due'].replace(day=1)
+        get_or_create_row(SalesDueSummary, sale_contact_id=sale_contact_id,
+                          month=month)
+        SalesDueSummary.objects.filter(
+            sale_contact_id=sale_contact_id, month=month).update(
+            contract_count=F('contract_count') + sign,
+            amount=F('amount') + amount)
+
+
+def contract_changed(old_values, new_values):
+    """
+    function moving a contract from its previous values to its new ones in
+    the summaries
+    :param old_values: dict from get_contract_values, None on creation
+    :param new_values: dict from get_contract_values, None on deletion
+    """
+    if old_values == new_values:
+        return
+    with transaction.atomic():
+        if old_values is not None:
+            count_contract(old_values, -1)
+        if new_values is not None:
+            count_contract(new_values, 1)
+
+
+def rebuild_sales_summary():
+    """
+    function recomputing the summaries from the contracts table, for the
+    changes made without signals (queryset update, raw SQL, user deletion
+    setting sale_contact to NULL)
+    :return: tuple, number of SalesSummary and SalesDueSummary rows
+    """
+    contracts = Contract.objects.filter(sale_contact__isnull=False) \
+        .order_by()
+    signed = Q(status=True)
+    pending = Q(status=False)
+    with transaction.atomic():
+        summaries = [
+            SalesSummary(
+                sale_contact_id=row['sale_contact'],
+                contract_count=row['contract_count'],
+                total_amount=row['total_amount'] or 0,
+                signed_count=row['signed_count'],
+                signed_amount=row['signed_amount'] or 0,
+                pending_count=row['pending_count'],
+                pending_amount=row['pending_amount'] or 0)
+            for row in contracts.values('sale_contact').annotate(
+                contract_count=Count('id'),
+                total_amount=Sum('amount'),
+                signed_count=Count('id', filter=signed),
+                signed_amount=Sum('amount', filter=signed),
+                pending_count=Count('id', filter=pending),
+                pending_amount=Sum('amount', filter=pending))
+        ]
+        dues = [
+            SalesDueSummary(sale_contact_id=row['sale_contact'],
+                            month=row['due_month'],
+                            contract_count=row['contract_count'],
+                            amount=row['amount'])
+            for row in contracts.filter(signed)
+            .annotate(due_month=TruncMonth('payement_due'))
+            .values('sale_contact', 'due_month')
+            .annotate(contract_count=Count('id'), amount=Sum('amount'))
+        ]
+        SalesSummary.objects.all().delete()
+        SalesDueSummary.objects.all().delete()
+        SalesSummary.objects.bulk_create(summaries)
+        SalesDueSummary.objects.bulk_create(dues)
+    return len(summaries), len(dues)
+
+
+def get_month(today=None, offset=0):
+    """
+    :return: date, first day of the month offset months after today's one
+    """
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_open_contracts_filter(today=None):
+    """
+    function to get the filter of the open contracts: the signed ones whose
+    payement_due month isn't over. The customers open_contract_amount sums
+    them, the dashboard open_amount sums the same contracts from the
+    SalesDueSummary rows of the months from get_month().
+    :param today: date, today by default
+    :return: Q object
+    """
+    return Q(status=True, payement_due__gte=get_month(today))
@@ -1,3 +1,1104 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from base64 import urlsafe_b64encode
+from datetime import date, datetime, timedelta, timezone
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models.signals import post_init
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from apps.API.api_filters import ContractFilter, EventFilter
+from apps.API.autocomplete import CustomerPrefixIndex, \
+    customer_prefix_index
+from apps.API.cache import DjangoCacheBackend, get_tag, retrieve_cache
+from apps.API.models import Customer, Contract, Event, SalesSummary, \
+    SalesDueSummary, StreamMessage, Tombstone
+from apps.API.stream import DatabaseBroker, stream_application
+from apps.API.rollups import refresh_closed_contract_rollups
+from apps.API.summary import get_month, rebuild_sales_summary
+from apps.authenticate.models import CustomUser
+from apps.authenticate.serializers import RoleTokenObtainPairSerializer
+from threading import Thread
+from time import monotonic, sleep
+import asyncio
+import json
 
-# Create your tests here.
+
+class APITestMixin:
+    """
+    Mixin creating customers having a contract and an event, and an API
+    client authenticated as their sale contact
+    """
+    @classmethod
+    def create_customers(cls, count):
+        for name in ('manager', 'sales', 'support'):
+            Group.objects.create(name=name)
+        cls.sales = CustomUser.objects.create(username='sales@test.test',
+                                              email='sales@test.test',
+                                              role='sales')
+        cls.support = CustomUser.objects.create(
+            username='support@test.test', email='support@test.test',
+            role='support')
+        for i in range(count):
+            customer = Customer.objects.create(
+                first_name='first', last_name=f'last{i}', phone='0102',
+                email=f'customer{i}@test.test', company=f'company{i}',
+                sale_contact=cls.sales)
+            contract = Contract.objects.create(
+                customer=customer, sale_contact=cls.sales, amount=i,
+                payement_due=date(2022, 1, 1))
+            Event.objects.create(
+                customer=customer, contract=contract,
+                support_contact=cls.support, note='note',
+                event_date=datetime(2022, 1, 1, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.sales)
+        # detail query counts are measured on cache misses
+        retrieve_cache.clear()
+
+
+class ListQueryCountTest(APITestMixin, TestCase):
+    """
+    Test that list and detail endpoints run a fixed number of queries,
+    whatever the number of results serialized
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_customers(12)
+
+    def assert_list_queries(self, endpoint, queries):
+        for limit in (2, 10):
+            with self.assertNumQueries(queries):
+                response = self.client.get(f'{endpoint}?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_customers_list(self):
+        self.assert_list_queries('/api/customers/', 2)
+
+    def test_contracts_list(self):
+        self.assert_list_queries('/api/contracts/', 2)
+
+    def test_events_list(self):
+        self.assert_list_queries('/api/events/', 2)
+
+    def test_sparse_fields_and_expand(self):
+        response = self.client.get(
+            '/api/contracts/?limit=1&fields=id,customer,sale_contact'
+            '&expand=customer')
+        contract = response.data['results'][0]
+        self.assertEqual(set(contract), {'id', 'customer', 'sale_contact'})
+        self.assertEqual(contract['sale_contact'], self.sales.id)
+        self.assertIn('company', contract['customer'])
+
+    def test_list_without_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/contracts/?limit=5&count=none')
+        self.assertNotIn('count', response.data)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_contract_detail(self):
+        contract = Contract.objects.first()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/contracts/{contract.id}/')
+        self.assertEqual(response.data['event']['id'],
+                         contract.event_set.get().id)
+
+    def test_contract_detail_multiple_events(self):
+        contract = Contract.objects.first()
+        Event.objects.create(
+            customer=contract.customer, contract=contract, note='note',
+            event_date=datetime(2022, 1, 2, tzinfo=timezone.utc))
+        response = self.client.get(f'/api/contracts/{contract.id}/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_event_detail(self):
+        event = Event.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/events/{event.id}/')
+        self.assertEqual(response.data['customer']['id'], event.customer_id)
+
+
+class RetrieveCacheTest(APITestMixin, TestCase):
+    """
+    Test that the detail responses are served from the retrieve cache until
+    an object they embed changes
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_customers(2)
+
+    def test_retrieve_cache(self):
+        contract = Contract.objects.first()
+        url = f'/api/contracts/{contract.id}/'
+        response = self.client.get(url)
+        response.data['amount'] = -1
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.data['amount'], contract.amount)
+
+        customer = contract.customer
+        customer.company = 'renamed'
+        customer.save()
+        self.assertEqual(self.client.get(url).data['customer']['company'],
+                         'renamed')
+        Event.objects.create(customer=customer, contract=contract,
+                             note='note', event_date=datetime(
+                                 2022, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(self.client.get(url).status_code, 409)
+
+    def test_retrieve_cache_write_during_load(self):
+        customer = Customer.objects.first()
+        url = f'/api/customers/{customer.id}/'
+
+        def write_committed(sender, instance, **kwargs):
+            # a write committed once the customer is loaded, before the
+            # response is stored
+            post_init.disconnect(write_committed, sender=Customer)
+            retrieve_cache.invalidate([get_tag(Customer, instance.id)])
+
+        post_init.connect(write_committed, sender=Customer)
+        self.addCleanup(post_init.disconnect, write_committed,
+                        sender=Customer)
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+
+class ConditionalGetTest(APITestMixin, TestCase):
+    """
+    Test the ETag validators of lists and the ETag and Last-Modified of
+    details
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_customers(6)
+
+    def test_conditional_get(self):
+        url = '/api/contracts/?limit=5'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        customer = Customer.objects.get(company='company1')
+        customer.company = 'renamed'
+        customer.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # pages without count are validated from their rows
+        url = '/api/contracts/?limit=5&count=none'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Contract.objects.filter(amount=2).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        contract = Contract.objects.first()
+        url = f'/api/contracts/{contract.id}/'
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+        self.sales.email = 'renamed@test.test'
+        self.sales.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.data['sale_contact']['email'],
+                         'renamed@test.test')
+
+    def test_list_without_last_modified(self):
+        url = '/api/contracts/?limit=5'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        # a deletion leaves the latest date_updated of the list unchanged
+        Contract.objects.filter(amount=2).delete()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT',
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class CreateEventTest(APITestMixin, TestCase):
+    """
+    Test that contracts/<id>/event/ creates the event of a contract once,
+    for its sale contact
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_customers(1)
+        cls.sales.groups.add(Group.objects.get(name='sales'))
+        cls.contract = Contract.objects.create(
+            customer=Customer.objects.get(), sale_contact=cls.sales,
+            amount=10, payement_due=date(2022, 1, 1))
+
+    def create_event(self):
+        return self.client.post(
+            f'/api/contracts/{self.contract.id}/event/',
+            {'support_contact': self.support.id, 'attendees': 10,
+             'event_date': '2022-02-01T20:00:00Z', 'note': 'note'})
+
+    def test_create_event(self):
+        response = self.create_event()
+        self.assertEqual(response.status_code, 201)
+        event = Event.objects.get(id=response.data['id'])
+        self.assertEqual(event.contract_id, self.contract.id)
+        self.assertEqual(event.customer_id, self.contract.customer_id)
+        self.contract.refresh_from_db()
+        self.assertTrue(self.contract.event_created)
+
+        response = self.create_event()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.contract.event_set.count(), 1)
+
+    def test_other_sales_refused(self):
+        other = CustomUser.objects.create(username='other@test.test',
+                                          email='other@test.test',
+                                          role='sales')
+        other.groups.add(Group.objects.get(name='sales'))
+        self.client.force_authenticate(other)
+        self.assertEqual(self.create_event().status_code, 403)
+        self.assertFalse(self.contract.event_set.exists())
+        self.contract.refresh_from_db()
+        self.assertFalse(self.contract.event_created)
+
+
+class SearchTest(APITestMixin, TestCase):
+    """
+    Test the full-text search of each model and api/search/ run in the
+    request thread
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_customers(12)
+
+    def test_full_text_search(self):
+        response = self.client.get('/api/customers/search/?q=company1')
+        self.assertEqual(response.data['count'], 3)
+        response = self.client.get('/api/contracts/search/?q=customer3')
+        self.assertEqual(
+            [contract['customer']['company']
+             for contract in response.data['results']], ['company3'])
+        Event.objects.filter(contract__amount=5).update(note='concert jazz')
+        response = self.client.get('/api/events/search/?q=jaz')
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get('/api/events/search/?q=')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(API_SEARCH_CONCURRENCY=1)
+    def test_unified_search(self):
+        response = self.client.get('/api/search/?q=company1&limit=2')
+        self.assertEqual(set(response.data['results']),
+                         {'customers', 'contracts', 'events'})
+        self.assertEqual(len(response.data['results']['customers']), 2)
+        self.assertTrue(response.data['meta']['customers']['truncated'])
+        self.assertEqual(response.data['meta']['events']['count'], 0)
+        self.assertIn('ms', response.data['meta']['contracts'])
+
+        manager = CustomUser.objects.create(username='manager@test.test',
+                                            email='manager@test.test',
+                                            role='manager')
+        manager.groups.add(Group.objects.get(name='manager'))
+        self.client.force_authenticate(manager)
+        response = self.client.get('/api/search/?q=support')
+        self.assertEqual([user['email']
+                          for user in response.data['results']['users']],
+                         ['support@test.test'])
+
+
+class AutocompleteTest(APITestMixin, TestCase):
+    """
+    Test the customers autocomplete prefix index
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_customers(12)
+
+    def test_autocomplete(self):
+        customer_prefix_index.clear()
+        self.addCleanup(customer_prefix_index.clear)
+        response = self.client.get('/api/customers/autocomplete/?q=Company1')
+        self.assertEqual([customer['company']
+                          for customer in response.data['results']],
+                         ['company1', 'company10', 'company11'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(
+                first_name='first', last_name='Martin', phone='0102',
+                email='contact@acme.test', company='Acme Corp')
+        for text in ('acm', 'corp', 'mart', 'contact@'):
+            with self.assertNumQueries(0):
+                response = self.client.get(
+                    f'/api/customers/autocomplete/?q={text}')
+            self.assertEqual([customer['company']
+                              for customer in response.data['results']],
+                             ['Acme Corp'])
+
+    def test_autocomplete_single_rebuild(self):
+        index = CustomerPrefixIndex(ttl=300)
+        self.assertEqual(len(index.search('company1')), 3)
+        index.built_at -= 301
+        # another request is rebuilding: the current index is searched
+        with index.build_lock:
+            with self.assertNumQueries(0):
+                self.assertEqual(len(index.search('company1')), 3)
+        with self.assertNumQueries(1):
+            index.search('company1')
+        self.assertFalse(index.is_stale())
+
+        builds = []
+        index = CustomerPrefixIndex(ttl=300)
+
+        def build():
+            builds.append(1)
+            sleep(0.05)
+            index.built_at = monotonic()
+
+        index.build = build
+        threads = [Thread(target=index.refresh) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+
+
+class UnifiedSearchTest(TransactionTestCase):
+    """
+    Test api/search/ with its sections run by the thread pool, which needs
+    the rows committed to be seen by the worker threads
+    """
+    def setUp(self):
+        self.manager = CustomUser.objects.create(
+            username='manager@test.test', email='manager@test.test',
+            role='manager')
+        self.manager.groups.add(Group.objects.create(name='manager'))
+        self.support = CustomUser.objects.create(
+            username='support@test.test', email='support@test.test',
+            role='support')
+        for i in range(3):
+            customer = Customer.objects.create(
+                first_name='first', last_name=f'last{i}', phone='0102',
+                email=f'customer{i}@test.test', company='company')
+            contract = Contract.objects.create(
+                customer=customer, amount=i, payement_due=date(2022, 1, 1))
+            Event.objects.create(
+                customer=customer, contract=contract,
+                support_contact=self.support, note='note',
+                event_date=datetime(2022, 1, 1, tzinfo=timezone.utc))
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_concurrent_sections(self):
+        self.assertGreater(settings.API_SEARCH_CONCURRENCY, 1)
+        response = self.client.get('/api/search/?q=company&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results']),
+                         {'customers', 'contracts', 'events', 'users'})
+        meta = response.data['meta']
+        self.assertEqual(len(response.data['results']['customers']), 2)
+        self.assertTrue(meta['customers']['truncated'])
+        self.assertEqual(meta['contracts']['count'], 2)
+        self.assertEqual(meta['users']['count'], 0)
+
+        response = self.client.get('/api/search/?q=support')
+        self.assertEqual([user['email']
+                          for user in response.data['results']['users']],
+                         ['support@test.test'])
+        with override_settings(API_SEARCH_CONCURRENCY=1):
+            sequential = self.client.get('/api/search/?q=support')
+        self.assertEqual(sequential.data['results'],
+                         response.data['results'])
+
+
+class DateFilterTest(TestCase):
+    """
+    Test that the date filters of contracts and events select the right
+    rows with range lookups on the indexed column
+    """
+    dates = {
+        'mar8': datetime(2022, 3, 8, 12, tzinfo=timezone.utc),
+        'mar9': datetime(2022, 3, 9, tzinfo=timezone.utc),
+        'mar9_late': datetime(2022, 3, 9, 23, 30, tzinfo=timezone.utc),
+        'mar10': datetime(2022, 3, 10, tzinfo=timezone.utc),
+        'apr1': datetime(2022, 4, 1, 12, tzinfo=timezone.utc),
+        'next_year': datetime(2023, 3, 9, 12, tzinfo=timezone.utc),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = CustomUser.objects.create(username='sales@test.test',
+                                              email='sales@test.test',
+                                              role='sales')
+        customer = Customer.objects.create(
+            first_name='first', last_name='last', phone='0102',
+            email='customer@test.test', company='company')
+        for note, value in cls.dates.items():
+            contract = Contract.objects.create(
+                customer=customer, amount=1, payement_due=date(2022, 1, 1))
+            # date_created is set on creation only
+            Contract.objects.filter(pk=contract.pk).update(
+                date_created=value)
+            Event.objects.create(customer=customer, contract=contract,
+                                 note=note, event_date=value)
+
+    def filter_events(self, data):
+        """
+        :return: tuple, set of the notes of the events kept and SQL query,
+        empty when the filter selects nothing
+        """
+        queryset = EventFilter(data, queryset=Event.objects.all()).qs
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            sql = ''
+        return set(queryset.values_list('note', flat=True)), sql
+
+    def assert_range_lookup(self, sql):
+        self.assertIn('"API_event"."event_date" >=', sql)
+        self.assertIn('"API_event"."event_date" <', sql)
+        self.assertNotIn('LIKE', sql)
+        self.assertNotIn('EXTRACT', sql.upper())
+
+    def test_date_contains(self):
+        march = {'mar8', 'mar9', 'mar9_late', 'mar10'}
+        expected = {
+            '2022-03-09': {'mar9', 'mar9_late'},
+            '09/03/2022': {'mar9', 'mar9_late'},
+            '2022-03': march,
+            '03/2022': march,
+            '2022': march | {'apr1'},
+        }
+        for value, notes in expected.items():
+            with self.subTest(value):
+                result, sql = self.filter_events({'date_contains': value})
+                self.assertEqual(result, notes)
+                self.assert_range_lookup(sql)
+        self.assertEqual(
+            self.filter_events({'date_contains': 'march'})[0], set())
+        self.assertEqual(
+            self.filter_events({'date_contains': '2022-02-30'})[0], set())
+
+    def test_date_contains_contracts(self):
+        client = APIClient()
+        client.force_authenticate(self.sales)
+        response = client.get('/api/contracts/',
+                              {'date_contains': '09/03/2022'})
+        self.assertEqual(
+            {contract['id'] for contract in response.data['results']},
+            set(Contract.objects.filter(event__note__startswith='mar9')
+                .values_list('id', flat=True)))
+        queryset = ContractFilter({'date_contains': '2022-03-09'},
+                                  queryset=Contract.objects.all()).qs
+        self.assertIn('"API_contract"."date_created" >=', str(queryset.query))
+        self.assertNotIn('LIKE', str(queryset.query))
+
+    def test_date_after_before(self):
+        # date_before includes its whole day
+        result, sql = self.filter_events({'date_after': '2022-03-09',
+                                          'date_before': '2022-03-09'})
+        self.assertEqual(result, {'mar9', 'mar9_late'})
+        self.assertIn('"API_event"."event_date" BETWEEN', sql)
+        result, sql = self.filter_events({'date_after': '2022-03-10'})
+        self.assertEqual(result, {'mar10', 'apr1', 'next_year'})
+        self.assertIn('"API_event"."event_date" >=', sql)
+        result, sql = self.filter_events({'date_before': '2022-03-08'})
+        self.assertEqual(result, {'mar8'})
+        self.assertIn('"API_event"."event_date" <=', sql)
+
+    def test_year_month_day(self):
+        expected = {
+            (('year', 2022), ('month', 3), ('day', 9)): {'mar9',
+                                                         'mar9_late'},
+            (('year', 2022), ('month', 4)): {'apr1'},
+            (('year', 2023),): {'next_year'},
+            # day only refines a month
+            (('year', 2023), ('day', 1)): {'next_year'},
+        }
+        for data, notes in expected.items():
+            with self.subTest(data):
+                result, sql = self.filter_events(dict(data))
+                self.assertEqual(result, notes)
+                self.assert_range_lookup(sql)
+        # month alone doesn't filter
+        result, sql = self.filter_events({'month': 3})
+        self.assertEqual(result, set(self.dates))
+        self.assertNotIn('WHERE', sql)
+        self.assertEqual(self.filter_events(
+            {'year': 2022, 'month': 2, 'day': 30})[0], set())
+
+
+class DjangoCacheBackendTest(TestCase):
+    """
+    Test that clearing a DjangoCacheBackend keeps the other entries of its
+    cache
+    """
+    def test_clear(self):
+        backend = DjangoCacheBackend(key_prefix='test')
+        other = DjangoCacheBackend(key_prefix='other')
+        cache.set('token_version:1', 3)
+        backend.set_many({'a': 1, 'b': 2})
+        other.set_many({'a': 3})
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+
+        backend.clear()
+        self.assertEqual(backend.get_many(['a', 'b']), {})
+        self.assertEqual(other.get_many(['a']), {'a': 3})
+        self.assertEqual(cache.get('token_version:1'), 3)
+        backend.set_many({'a': 4})
+        backend.delete_many(['b'])
+        self.assertEqual(backend.get_many(['a', 'b']), {'a': 4})
+
+    def test_long_key(self):
+        # retrieve keys hold the query parameters
+        backend = DjangoCacheBackend(key_prefix='test')
+        key = 'retrieve:api.contract:1:' + 'fields=id,' * 50
+        self.assertLessEqual(len(backend.make_keys([key])[key]), 250)
+        backend.set_many({key: 1})
+        self.assertEqual(backend.get_many([key]), {key: 1})
+
+
+class SalesSummaryTest(TestCase):
+    """
+    Test that the Contract signals keep the sales summaries equal to a
+    rebuild from the contracts
+    """
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('manager', 'sales', 'support'):
+            Group.objects.create(name=name)
+        cls.manager = CustomUser.objects.create(
+            username='manager@test.test', email='manager@test.test',
+            role='manager')
+        cls.manager.groups.add(Group.objects.get(name='manager'))
+        cls.sales = [
+            CustomUser.objects.create(username=f'sales{i}@test.test',
+                                      email=f'sales{i}@test.test',
+                                      role='sales')
+            for i in range(2)]
+        cls.customer = Customer.objects.create(
+            first_name='first', last_name='last', phone='0102',
+            email='customer@test.test', company='company')
+
+    def get_summaries(self):
+        return (
+            list(SalesSummary.objects.order_by('sale_contact_id').values(
+                'sale_contact_id', 'contract_count', 'total_amount',
+                'signed_count', 'signed_amount', 'pending_count',
+                'pending_amount')),
+            list(SalesDueSummary.objects.filter(contract_count__gt=0)
+                 .order_by('sale_contact_id', 'month')
+                 .values('sale_contact_id', 'month', 'contract_count',
+                         'amount')))
+
+    def test_signals_match_rebuild(self):
+        contracts = [
+            Contract.objects.create(
+                customer=self.customer, sale_contact=self.sales[i % 2],
+                amount=100 * i, status=bool(i % 3),
+                payement_due=date(2030, i % 4 + 1, 15))
+            for i in range(10)]
+        contracts[0].amount = 50
+        contracts[0].status = True
+        contracts[0].save()
+        contracts[1].sale_contact = self.sales[0]
+        contracts[1].payement_due = '2031-01-01'
+        contracts[1].save()
+        contracts[2].delete()
+
+        incremental = self.get_summaries()
+        self.assertEqual(sum(row['contract_count']
+                             for row in incremental[0]), 9)
+        rebuild_sales_summary()
+        self.assertEqual(self.get_summaries()[0], incremental[0])
+        self.assertEqual(self.get_summaries()[1], incremental[1])
+
+    def test_dashboard(self):
+        for i in range(4):
+            Contract.objects.create(
+                customer=self.customer, sale_contact=self.sales[0],
+                amount=10, status=True, payement_due=date(2999, 1, 1))
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        with self.assertNumQueries(4):
+            response = client.get('/api/dashboard/sales/')
+        self.assertEqual(response.data[0]['total_amount'], 40)
+        self.assertEqual(response.data[0]['open_amount'], 40)
+        response = client.get('/api/dashboard/sales/',
+                              {'sale_contact': self.sales[0].id})
+        self.assertEqual(len(response.data), 1)
+        response = client.get('/api/dashboard/sales/',
+                              {'sale_contact': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+        self.sales[1].groups.add(Group.objects.get(name='sales'))
+        client.force_authenticate(self.sales[1])
+        response = client.get('/api/dashboard/sales/')
+        self.assertEqual(response.data, [])
+
+
+class EventCalendarTest(TestCase):
+    """
+    Test the events calendar buckets and its query count
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.support = CustomUser.objects.create(
+            username='support@test.test', email='support@test.test',
+            role='support')
+        customer = Customer.objects.create(
+            first_name='first', last_name='last', phone='0102',
+            email='customer@test.test', company='company')
+        for day, hour, attendees in ((1, 9, 10), (1, 18, 5), (3, 12, 7),
+                                     (15, 8, 1), (28, 23, 2)):
+            contract = Contract.objects.create(
+                customer=customer, amount=1, payement_due=date(2022, 3, 1))
+            Event.objects.create(
+                customer=customer, contract=contract, note='note',
+                support_contact=cls.support if day < 20 else None,
+                attendees=attendees,
+                event_date=datetime(2022, 3, day, hour, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.support)
+
+    def test_calendar_days(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/events/calendar/?from=2022-03&to=2022-03')
+        self.assertEqual(response.data['event_count'], 5)
+        self.assertEqual(response.data['attendees'], 25)
+        self.assertEqual(
+            [(day['date'], day['event_count'], day['attendees'])
+             for day in response.data['days']],
+            [('2022-03-01', 2, 15), ('2022-03-03', 1, 7),
+             ('2022-03-15', 1, 1), ('2022-03-28', 1, 2)])
+        self.assertIn('company',
+                      response.data['days'][0]['events'][0]['customer'])
+
+    def test_calendar_totals_and_filters(self):
+        response = self.client.get(
+            f'/api/events/calendar/?from=2022-03-01&to=2022-03-20'
+            f'&support_contact={self.support.id}&events=false')
+        self.assertEqual(
+            [(day['date'], day['event_count'], day['attendees'])
+             for day in response.data['days']],
+            [('2022-03-01', 2, 15), ('2022-03-03', 1, 7),
+             ('2022-03-15', 1, 1)])
+        response = self.client.get('/api/events/calendar/?from=2022-01'
+                                   '&to=2022-12')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/events/calendar/?from=foo')
+        self.assertEqual(response.status_code, 400)
+
+
+class CustomerRollupTest(TestCase):
+    """
+    Test that the customer rollups follow the contracts and events changes
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='sales@test.test',
+                                             email='sales@test.test')
+        cls.customers = [
+            Customer.objects.create(
+                first_name='first', last_name=f'last{i}', phone='0102',
+                email=f'customer{i}@test.test', company=f'company{i}')
+            for i in range(2)]
+
+    def assert_rollups(self, customer, **values):
+        customer = Customer.objects.get(id=customer.id)
+        for field, value in values.items():
+            self.assertEqual(getattr(customer, field), value, field)
+
+    def test_rollups(self):
+        first, second = self.customers
+        contracts = [
+            Contract.objects.create(customer=first, amount=amount,
+                                    status=status,
+                                    payement_due=get_month(offset=1))
+            for amount, status in ((100, True), (50, False), (10, True))]
+        self.assert_rollups(first, contract_count=3,
+                            total_contract_amount=160,
+                            open_contract_amount=110)
+        dates = [datetime(2022, month, 1, tzinfo=timezone.utc)
+                 for month in (5, 3, 4)]
+        events = [Event.objects.create(customer=first, contract=contract,
+                                       note='note', event_date=event_date)
+                  for contract, event_date in zip(contracts, dates)]
+        self.assert_rollups(first, event_count=3, next_event_date=dates[1])
+
+        events[1].event_status = False
+        events[1].save()
+        self.assert_rollups(first, next_event_date=dates[2])
+
+        # a stale customer instance doesn't overwrite the rollups
+        first.company = 'renamed'
+        first.save()
+        contracts[0].customer = second
+        contracts[0].save()
+        self.assert_rollups(first, contract_count=2, open_contract_amount=10,
+                            company='renamed')
+        self.assert_rollups(second, contract_count=1,
+                            open_contract_amount=100)
+
+        contracts[2].delete()
+        self.assert_rollups(first, contract_count=1, event_count=2,
+                            next_event_date=dates[0])
+
+    def test_open_contracts(self):
+        first, second = self.customers
+        for customer, amount, offset in ((first, 100, 0), (first, 10, 1),
+                                         (second, 5, 0), (second, 1, -1)):
+            Contract.objects.create(customer=customer, amount=amount,
+                                    sale_contact=self.user,
+                                    payement_due=get_month(offset=offset))
+        self.assert_rollups(first, open_contract_amount=110)
+        self.assert_rollups(second, open_contract_amount=5)
+
+        # the dashboard open_amount sums the same contracts
+        client = APIClient()
+        client.force_authenticate(self.user)
+        manager = Group.objects.create(name='manager')
+        self.user.groups.add(manager)
+        response = client.get('/api/dashboard/sales/')
+        self.assertEqual(response.data[0]['open_amount'], 115)
+
+        # next month, the contracts due this month are closed
+        next_month = get_month(offset=1)
+        self.assertEqual(refresh_closed_contract_rollups(next_month), 2)
+        self.assert_rollups(first, open_contract_amount=10)
+        self.assert_rollups(second, open_contract_amount=0)
+        self.assertEqual(refresh_closed_contract_rollups(), 1)
+
+    def test_ordering(self):
+        Contract.objects.create(customer=self.customers[1], amount=1,
+                                payement_due=date(2022, 1, 1))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/customers/?ordering=-contract_count')
+        self.assertEqual([customer['id']
+                          for customer in response.data['results']],
+                         [self.customers[1].id, self.customers[0].id])
+        response = client.get(f'/api/customers/{self.customers[1].id}/')
+        self.assertEqual(response.data['contract_count'], 1)
+
+
+class SyncFeedTest(TestCase):
+    """
+    Test the updated_since filter and the deletions feeds
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='sales@test.test',
+                                             email='sales@test.test',
+                                             role='sales')
+        cls.customers = [
+            Customer.objects.create(first_name='first', last_name='last',
+                                    phone='0102', email='c@test.test',
+                                    company=f'company{i}')
+            for i in range(2)]
+        cls.contract = Contract.objects.create(
+            customer=cls.customers[0], amount=1,
+            payement_due=date(2022, 1, 1))
+        cls.event = Event.objects.create(
+            customer=cls.customers[0], contract=cls.contract, note='note',
+            event_date=datetime(2022, 1, 1, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_updated_since(self):
+        since = datetime.now(timezone.utc).isoformat()
+        self.customers[1].company = 'renamed'
+        self.customers[1].save()
+        response = self.client.get('/api/customers/',
+                                   {'updated_since': since})
+        self.assertEqual([customer['id']
+                          for customer in response.data['results']],
+                         [self.customers[1].id])
+        response = self.client.get('/api/contracts/',
+                                   {'updated_since': since})
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get('/api/events/?updated_since=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_updated_since_pages(self):
+        since = datetime(2000, 1, 1, tzinfo=timezone.utc).isoformat()
+        for i in range(2, 5):
+            self.customers.append(Customer.objects.create(
+                first_name='first', last_name='last', phone='0102',
+                email='c@test.test', company=f'company{i}'))
+        response = self.client.get('/api/customers/',
+                                   {'updated_since': since, 'limit': 2})
+        seen = [customer['id'] for customer in response.data['results']]
+        ids = [customer.id for customer in self.customers]
+        self.assertEqual(sorted(seen), ids[:2])
+        # deleting a row already seen doesn't shift the next page, a row
+        # saved during the sync comes again at the end
+        self.customers[0].delete()
+        self.customers[2].save()
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [customer['id'] for customer in response.data['results']]
+        self.assertEqual(seen[2:], [ids[3], ids[4], ids[2]])
+
+    def test_deleted(self):
+        since = datetime.now(timezone.utc).isoformat()
+        deleted = {'customers': self.customers[0].id,
+                   'contracts': self.contract.id, 'events': self.event.id}
+        self.customers[0].delete()
+        for endpoint, object_id in deleted.items():
+            response = self.client.get(f'/api/{endpoint}/deleted/',
+                                       {'since': since})
+            self.assertEqual([row['id'] for row in response.data['results']],
+                             [object_id])
+
+        self.assertEqual(
+            self.client.get('/api/customers/deleted/').status_code, 400)
+        response = self.client.get('/api/customers/deleted/',
+                                   {'since': '2000-01-01T00:00:00Z'})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(Tombstone.objects.count(), 3)
+
+
+class KeysetPaginationTest(TestCase):
+    """
+    Test the ?pagination=cursor links, with rows sharing their date
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = CustomUser.objects.create(username='sales@test.test',
+                                              email='sales@test.test',
+                                              role='sales')
+        for i in range(12):
+            Customer.objects.create(
+                first_name='first', last_name=f'last{i}', phone='0102',
+                email=f'customer{i}@test.test', company=f'company{i}',
+                sale_contact=cls.sales)
+        # ties on date_created are ordered by id
+        Customer.objects.update(
+            date_created=datetime(2022, 1, 1, tzinfo=timezone.utc))
+        cls.ids = list(Customer.objects.order_by('id')
+                       .values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.sales)
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_ids(self, page):
+        return [customer['id'] for customer in page['results']]
+
+    def test_links(self):
+        page = self.get_page('/api/customers/?pagination=cursor&limit=5')
+        self.assertIsNone(page['previous'])
+        pages = [page]
+        while page['next']:
+            page = self.get_page(page['next'])
+            pages.append(page)
+        self.assertEqual([len(page['results']) for page in pages], [5, 5, 2])
+        self.assertEqual([id for page in pages for id in self.get_ids(page)],
+                         self.ids)
+
+        # back from the last page
+        page = self.get_page(pages[-1]['previous'])
+        self.assertEqual(self.get_ids(page), self.ids[5:10])
+        page = self.get_page(page['previous'])
+        self.assertEqual(self.get_ids(page), self.ids[:5])
+        self.assertIsNone(page['previous'])
+        self.assertEqual(self.get_ids(self.get_page(page['next'])),
+                         self.ids[5:10])
+
+    def test_invalid_cursor(self):
+        cursors = [
+            'not-base64!',
+            urlsafe_b64encode(b'not json').decode(),
+            urlsafe_b64encode(json.dumps({'r': False}).encode()).decode(),
+            urlsafe_b64encode(json.dumps(
+                {'r': False, 'v': ['2022-01-01']}).encode()).decode(),
+            urlsafe_b64encode(json.dumps(
+                {'r': False, 'v': ['not a date', 1]}).encode()).decode(),
+            urlsafe_b64encode(json.dumps(
+                {'r': False, 'v': ['2022-01-01T00:00:00+00:00', 'x']})
+                .encode()).decode(),
+            urlsafe_b64encode(json.dumps(
+                {'r': True, 'v': [[], {}]}).encode()).decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor):
+                response = self.client.get(
+                    '/api/customers/', {'pagination': 'cursor',
+                                        'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+
+class EventStreamTest(TransactionTestCase):
+    """
+    Test that the changes are streamed to their sale or support contact
+    """
+    def setUp(self):
+        self.sales = [
+            CustomUser.objects.create(username=f'sales{i}@test.test',
+                                      email=f'sales{i}@test.test',
+                                      role='sales')
+            for i in range(2)]
+        self.customer = Customer.objects.create(
+            first_name='first', last_name='last', phone='0102',
+            email='customer@test.test', company='company')
+
+    def get_scope(self, headers):
+        return {'type': 'http', 'method': 'GET', 'path': '/api/stream/',
+                'headers': headers}
+
+    async def open_stream(self, headers):
+        """
+        :return: tuple, queue of the messages sent and disconnect event
+        """
+        messages = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        task = asyncio.ensure_future(stream_application(
+            self.get_scope(headers), receive, messages.put))
+        return messages, disconnected, task
+
+    def create_contract(self, sale_contact):
+        return Contract.objects.create(
+            customer=self.customer, sale_contact=sale_contact, amount=1,
+            payement_due=date(2022, 1, 1)).id
+
+    def reassign_contract(self, contract_id, sale_contact):
+        contract = Contract.objects.get(pk=contract_id)
+        contract.sale_contact = sale_contact
+        contract.save()
+
+    def test_stream(self):
+        token = str(RoleTokenObtainPairSerializer.get_token(
+            self.sales[0]).access_token)
+
+        async def scenario():
+            messages, disconnected, task = await self.open_stream(
+                [(b'cookie', f'access={token}'.encode())])
+            start = await messages.get()
+            self.assertEqual(start['status'], 200)
+            ready = await messages.get()
+            self.assertTrue(ready['body'].startswith(b'event: ready'))
+
+            create = sync_to_async(self.create_contract,
+                                   thread_sensitive=False)
+            await create(self.sales[1])
+            contract_id = await create(self.sales[0])
+            change = await asyncio.wait_for(messages.get(), 5)
+            # the contract of the other sales user isn't streamed
+            self.assertTrue(change['body'].startswith(b'event: contract'))
+            self.assertIn(f'"id": {contract_id}'.encode(), change['body'])
+            self.assertIn(b'"action": "created"', change['body'])
+
+            # the previous contact is notified of the reassignment
+            await sync_to_async(self.reassign_contract,
+                                thread_sensitive=False)(contract_id,
+                                                        self.sales[1])
+            change = await asyncio.wait_for(messages.get(), 5)
+            self.assertIn(f'"id": {contract_id}'.encode(), change['body'])
+            self.assertIn(b'"action": "updated"', change['body'])
+            disconnected.set()
+            await task
+
+        asyncio.run(scenario())
+
+    def test_unauthenticated(self):
+        async def scenario():
+            messages, _, task = await self.open_stream(
+                [(b'authorization', b'Bearer invalid')])
+            await task
+            return await messages.get()
+
+        self.assertEqual(asyncio.run(scenario())['status'], 401)
+
+
+class DatabaseBrokerTest(TransactionTestCase):
+    """
+    Test that the DatabaseBroker hands the changes published by a process
+    to the streams of another one
+    """
+    def setUp(self):
+        # one broker per simulated process, polled by the test
+        self.publisher = DatabaseBroker(interval=3600)
+        self.subscriber = DatabaseBroker(interval=3600)
+
+    async def subscribe(self, topics):
+        subscription = self.subscriber.subscribe(topics)
+        # the poller thread starts by reading the last id
+        while self.subscriber.last_id is None:
+            await asyncio.sleep(0.01)
+        return subscription
+
+    def poll(self):
+        return sync_to_async(self.subscriber.poll, thread_sensitive=False)()
+
+    def test_publish(self):
+        async def scenario():
+            subscription = await self.subscribe(['user:1'])
+            publish = sync_to_async(self.publisher.publish,
+                                    thread_sensitive=False)
+            await publish(['user:2'], b'event: other\n\n')
+            await publish(['managers', 'user:1'], b'event: mine\n\n')
+            self.assertEqual(await self.poll(), 2)
+            frame = await asyncio.wait_for(subscription.get(), 1)
+            self.assertEqual(frame, b'event: mine\n\n')
+            self.assertTrue(subscription.queue.empty())
+            self.assertEqual(await self.poll(), 0)
+            self.subscriber.unsubscribe(subscription)
+
+        asyncio.run(scenario())
+
+    def test_skipped_id(self):
+        async def scenario():
+            subscription = await self.subscribe(['user:1'])
+            last_id = self.subscriber.last_id
+            create = sync_to_async(StreamMessage.objects.create,
+                                   thread_sensitive=False)
+            # a transaction committed after a later one
+            await create(id=last_id + 2, topics=['user:1'], frame='late')
+            self.assertEqual(await self.poll(), 1)
+            self.assertIn(last_id + 1, self.subscriber.pending)
+            await create(id=last_id + 1, topics=['user:1'], frame='early')
+            self.assertEqual(await self.poll(), 1)
+            self.assertEqual(self.subscriber.pending, {})
+            self.assertEqual(await subscription.get(), b'late')
+            self.assertEqual(await subscription.get(), b'early')
+            self.subscriber.unsubscribe(subscription)
+
+        asyncio.run(scenario())
+
+    def test_publish_prunes(self):
+        # a process writing the changes without any stream open
+        StreamMessage.objects.create(topics=['user:1'], frame='old')
+        StreamMessage.objects.update(
+            date_created=datetime.now(timezone.utc) - timedelta(seconds=600))
+        self.publisher.publish(['user:1'], b'event: new\n\n')
+        self.assertEqual(StreamMessage.objects.count(), 2)
+        self.publisher.pruned_at -= self.publisher.retention + 1
+        self.publisher.publish(['user:1'], b'event: newer\n\n')
+        self.assertEqual(list(StreamMessage.objects.values_list(
+            'frame', flat=True).order_by('id')),
+            ['event: new\n\n', 'event: newer\n\n'])
+        self.assertIsNone(self.publisher.poller)
@@ -1,13 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from rest_framework import status
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from apps.authenticate.models import CustomUser
+from apps.authenticate.serializers import DetailCustomUserSerializer
 from .serializers import *
 from rest_framework.permissions import IsAuthenticated
+from django_filters.fields import IsoDateTimeField
+from django_filters.rest_framework import DjangoFilterBackend
 import P12_backend.permissions as perms
 from .api_filters import *
+from .pagination import CountModePagination, KeysetPagination
+from .search import customer_index, event_index
+from .autocomplete import customer_prefix_index
+from .summary import get_month
+from .cache import get_instance_tags, get_retrieve_key, retrieve_cache, \
+    get_users_version
+from datetime import timedelta
+import hashlib
+import json
+
+
+def select_serializer_relations(queryset, serializer_class, request=None):
+    """
+    function joining or prefetching the relations declared by a serializer.
+    With ?fields= and ?expand=, only the nested objects rendered are joined,
+    reverse relations are prefetched as soon as their field is rendered.
+    :param queryset: queryset serialized
+    :param serializer_class: serializer class
+    :param request: API request
+    :return: queryset
+    """
+    fields, expand = get_requested_fields(serializer_class, request)
+    select = [
+        lookup for field, lookup
+        in get_related_fields(serializer_class, 'select_related_fields')
+        if (fields is None or field in fields)
+        and (expand is None or field in expand)
+    ]
+    prefetch = [
+        lookup for field, lookup
+        in get_related_fields(serializer_class, 'prefetch_related_fields')
+        if fields is None or field in fields
+    ]
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
 
 
 class ApiViewsetMixin:
     """
-    Mixin handling permissions and serializers selection for each viewset
+    Mixin handling permissions, serializers selection and queryset relations
+    for each viewset
     """
     serializer_actions = ['retrieve']
     edit_serializer = ['update', 'partial_update']
@@ -24,6 +84,20 @@ class ApiViewsetMixin:
     edit_permissions = [IsAuthenticated, perms.IsSaleReferee]
     create_permissions = [IsAuthenticated, perms.IsSales]
     delete_permissions = [IsAuthenticated, perms.IsManager]
+    # permissions for extra actions, by action name
+    action_permissions = {}
+
+    # ordering fields used by ?pagination=cursor, None to disable it
+    keyset_ordering = None
+    # ordering fields of the keyset pagination of ?updated_since= lists, so
+    # rows deleted or saved during a sync don't shift the following pages
+    sync_ordering = ('date_updated', 'id')
+    # default count of paginated lists: 'exact', 'estimate' or 'none',
+    # can be overridden per request with ?count=
+    count_mode = 'exact'
+    # foreign keys whose date_updated is part of the ETag / Last-Modified
+    # of list and retrieve, because their data is embedded
+    validator_relations = ()
 
     def get_serializer_class(self):
         """
@@ -38,13 +112,214 @@ class ApiViewsetMixin:
             return self.create_serializer_class
         return super().get_serializer_class()
 
+    @property
+    def paginator(self):
+        """
+        paginator selection logic, keyset pagination is used on
+        sync_ordering for ?updated_since= lists, and when requested with
+        ?pagination=cursor on viewsets defining keyset_ordering
+        :return: paginator instance
+        """
+        if not hasattr(self, '_paginator') and self.action == 'list':
+            params = self.request.query_params
+            if 'updated_since' in params:
+                self._paginator = KeysetPagination(self.sync_ordering)
+            elif self.keyset_ordering \
+                    and params.get('pagination') == 'cursor':
+                self._paginator = KeysetPagination(self.keyset_ordering)
+        return super().paginator
+
+    def get_queryset(self):
+        """
+        queryset joining or prefetching the relations declared by the
+        serializer of the current action
+        :return: queryset
+        """
+        return select_serializer_relations(super().get_queryset(),
+                                           self.get_serializer_class(),
+                                           getattr(self, 'request', None))
+
+    def get_queryset_dates(self, queryset):
+        """
+        get the validator values of a queryset with one aggregate query:
+        max date_updated of the rows and of the validator relations, and
+        count of the rows, kept in result_count for the paginator
+        :param queryset: queryset of the rows returned
+        :return: dict
+        """
+        aggregates = {'date_updated': Max('date_updated'),
+                      'count': Count('pk')}
+        for relation in self.validator_relations:
+            aggregates[relation] = Max(relation + '__date_updated')
+        values = queryset.order_by().aggregate(**aggregates)
+        self.result_count = values['count']
+        return values
+
+    def get_instance_dates(self, instance):
+        """
+        get the validator values of an object from the relations get_object
+        already joined
+        :param instance: model instance
+        :return: dict, None when a relation is not loaded
+        """
+        values = {'date_updated': instance.date_updated, 'count': 1}
+        for relation in self.validator_relations:
+            field = instance._meta.get_field(relation)
+            if not field.is_cached(instance):
+                return None
+            related = getattr(instance, relation)
+            values[relation] = related.date_updated if related else None
+        return values
+
+    def get_validators(self, values):
+        """
+        compute the ETag and Last-Modified of a list or retrieve response.
+        The ETag varies with the url, the serializer, the format, the
+        embedded users version and the validator values. Lists have no
+        Last-Modified: deleting a row does not move their latest date.
+        :param values: dict from get_queryset_dates or get_instance_dates
+        :return: tuple, quoted ETag and Last-Modified timestamp or None
+        """
+        dates = [values[name]
+                 for name in ('date_updated', *self.validator_relations)
+                 if values.get(name) is not None]
+        serializer_class = self.get_serializer_class()
+        fingerprint = json.dumps([
+            self.request.path,
+            sorted(self.request.query_params.lists()),
+            serializer_class.__module__ + '.' + serializer_class.__name__,
+            getattr(self.request.accepted_renderer, 'format', None),
+            get_users_version(),
+            {name: str(value) for name, value in values.items()},
+        ])
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        if self.action == 'list' or not dates:
+            return etag, None
+        return etag, int(max(dates).timestamp())
+
+    def get_page_dates(self, page):
+        """
+        get the validator values of a page fetched without exact count, from
+        its rows, so counting the whole list is not needed
+        :param page: list of model instances
+        :return: dict
+        """
+        ids = [row.pk for row in page]
+        rows = [self.get_instance_dates(row) for row in page]
+        if None in rows:
+            values = self.get_queryset_dates(
+                self.get_queryset().filter(pk__in=ids))
+        else:
+            values = {name: max((row[name] for row in rows
+                                 if row[name] is not None), default=None)
+                      for name in ('date_updated', *self.validator_relations)}
+        paginator = self.paginator
+        values.update({
+            'ids': ids,
+            'count': getattr(paginator, 'count', None),
+            'next': getattr(paginator, 'has_next', None),
+            'previous': getattr(paginator, 'has_previous', None),
+        })
+        return values
+
+    def counts_results(self):
+        """
+        :return: boolean, False when the list is paginated without exact
+        count (?count=none|estimate or ?pagination=cursor)
+        """
+        paginator = self.paginator
+        if isinstance(paginator, KeysetPagination):
+            return False
+        if isinstance(paginator, CountModePagination):
+            return paginator.get_limit(self.request) is None \
+                or paginator.get_count_mode(self.request, self) == 'exact'
+        return True
+
+    def get_object_validators(self, instance):
+        values = self.get_instance_dates(instance)
+        if values is None:
+            values = self.get_queryset_dates(
+                self.get_queryset().filter(pk=instance.pk))
+        return self.get_validators(values)
+
+    def conditional_response(self, request, validators, get_response):
+        """
+        answer 304 Not Modified without serializing when the client's
+        If-None-Match / If-Modified-Since validators still match
+        :param validators: tuple from get_validators
+        :param get_response: callable building the full response
+        :return: response
+        """
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        list answered with 304 when the client's validators match. They are
+        computed with an aggregate query whose count is reused by the
+        paginator, or from the page rows when no exact count is needed.
+        :return: Response with the serialized page
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.counts_results():
+            validators = self.get_validators(
+                self.get_queryset_dates(queryset))
+            return self.conditional_response(
+                request, validators,
+                lambda: super(ApiViewsetMixin, self).list(request, *args,
+                                                          **kwargs))
+        page = self.paginate_queryset(queryset)
+        validators = self.get_validators(self.get_page_dates(page))
+        return self.conditional_response(
+            request, validators,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        retrieve answered from the retrieve cache when possible, with 304
+        when the client's validators match. Cache entries keep the
+        validators of the object and are tagged with the object and the
+        objects its foreign keys point to, the model signals invalidate them.
+        :return: Response with the serialized object
+        """
+        if retrieve_cache is None:
+            instance = self.get_object()
+            validators = self.get_object_validators(instance)
+            return self.conditional_response(
+                request, validators,
+                lambda: Response(self.get_serializer(instance).data))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        key = get_retrieve_key(self, kwargs[lookup_url_kwarg])
+        entry = retrieve_cache.get(key)
+        if entry is None:
+            generation = retrieve_cache.get_generation()
+            instance = self.get_object()
+            validators = self.get_object_validators(instance)
+            entry = (validators, self.get_serializer(instance).data)
+            retrieve_cache.set(key, entry, get_instance_tags(instance),
+                               generation)
+        validators, data = entry
+        return self.conditional_response(request, validators,
+                                         lambda: Response(data))
+
     def get_permissions(self):
         """
         permissions logic
         :return: set of booelans for each permissions in selected
         permissions_class
         """
-        if self.action in self.edit_actions:
+        if self.action in self.action_permissions:
+            self.permission_classes = self.action_permissions[self.action]
+        elif self.action in self.edit_actions:
             self.permission_classes = self.edit_permissions
         elif self.action =='create':
             self.permission_classes = self.create_permissions
@@ -53,40 +328,166 @@ class ApiViewsetMixin:
         return super().get_permissions()
 
 
-class CustomersViewset(ApiViewsetMixin, ModelViewSet):
+class FullTextSearchMixin:
+    """
+    Mixin adding a search/?q= action returning the objects matching the
+    full-text index of search_index, best ranked first
+    """
+    search_index = None
+    # foreign key to the indexed model, '' for the viewset model itself
+    search_path = ''
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        full-text search, filters and pagination of list also apply
+        :return: Response with the ranked objects
+        """
+        text = request.query_params.get('q', '')
+        if not text.strip():
+            raise ValidationError({'q': 'This parameter is required'})
+        queryset = self.search_index.search(
+            self.filter_queryset(self.get_queryset()), text, self.search_path)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class DeletedFeedMixin:
+    """
+    Mixin adding a deleted/?since= action returning the objects deleted
+    since a datetime, recorded as tombstones for SYNC_TOMBSTONE_DAYS days
+    """
+    @action(detail=False, methods=['get'], url_path='deleted')
+    def deleted(self, request):
+        """
+        deletions of the viewset model, oldest first
+        :return: Response with the ids and deletion dates, 410 when since
+        is older than the tombstones kept
+        """
+        try:
+            since = IsoDateTimeField().clean(request.query_params.get('since'))
+        except DjangoValidationError as error:
+            raise ValidationError({'since': error.messages})
+        if since is None:
+            raise ValidationError({'since': 'This parameter is required'})
+        retention = timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        if since < timezone.now() - retention:
+            return Response(
+                {'detail': 'deletions older than '
+                           f'{settings.SYNC_TOMBSTONE_DAYS} days are not '
+                           'kept, a full sync is needed'},
+                status=status.HTTP_410_GONE)
+        queryset = Tombstone.objects.filter(
+            model_name=self.queryset.model._meta.model_name,
+            date_deleted__gte=since).order_by('date_deleted', 'id')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = TombstoneSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(TombstoneSerializer(queryset, many=True).data)
+
+
+class CustomersViewset(FullTextSearchMixin, DeletedFeedMixin, ApiViewsetMixin,
+                       ModelViewSet):
     """
     Viewset for customers
     """
+    queryset = Customer.objects.order_by('id')
     serializer_class = ListCustomersSerializer
     create_serializer_class = CreateCustomerSerializer
     detail_serializer_class = DetailCustomersSerializer
     edit_serializer_class = EditCustomersSerializer
 
+    keyset_ordering = ('date_created', 'id')
+    search_index = customer_index
+
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
     filterset_class = CustomerFilter
+    # rollup columns are on the customer table, sorting needs no join
+    ordering_fields = ['contract_count', 'total_contract_amount',
+                       'open_contract_amount', 'event_count',
+                       'next_event_date', 'date_created', 'company',
+                       'last_name']
 
-    def get_queryset(self):
-        return Customer.objects.all()
+    autocomplete_limit = 10
+    autocomplete_max_limit = 50
+
+    @action(detail=False, methods=['get'], url_path='autocomplete')
+    def autocomplete(self, request):
+        """
+        customers whose company, last_name (or one of their words) or email
+        starts with ?q=, answered from the in-process prefix index
+        :return: Response with at most ?limit= customers
+        """
+        try:
+            limit = min(int(request.query_params['limit']),
+                        self.autocomplete_max_limit)
+        except (KeyError, ValueError):
+            limit = self.autocomplete_limit
+        results = customer_prefix_index.search(
+            request.query_params.get('q', ''), max(limit, 1))
+        return Response({'results': results})
 
 
-class ContractViewset(ApiViewsetMixin, ModelViewSet):
+class ContractViewset(FullTextSearchMixin, DeletedFeedMixin, ApiViewsetMixin,
+                      ModelViewSet):
     """
     Viewset for Contract
     """
+    queryset = Contract.objects.order_by('id')
     serializer_class = ListContractSerializer
     create_serializer_class = CreateContractSerializer
     detail_serializer_class = DetailContractSerializer
     edit_serializer_class = EditContractSerializer
 
+    action_permissions = {
+        'create_event': [IsAuthenticated, perms.IsSales, perms.IsSaleReferee]
+    }
+
+    keyset_ordering = ('date_created', 'id')
+    # the embedded event needs no validator, creating, deleting or moving an
+    # event refreshes the customer rollups and date_updated
+    validator_relations = ('customer',)
+    # contracts are found by their customer
+    search_index = customer_index
+    search_path = 'customer'
+
     filterset_class = ContractFilter
 
-    def get_queryset(self):
-        return Contract.objects.all()
+    @action(detail=True, methods=['post'], url_path='event')
+    def create_event(self, request, pk=None):
+        """
+        create the event of a contract and set contract.event_created in a
+        single transaction
+        :return: Response with the created event
+        """
+        contract = self.get_object()
+        data = request.data.copy()
+        data['contract'] = contract.id
+        data['customer'] = contract.customer_id
+        serializer = CreateEventSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            contract = Contract.objects.select_for_update().get(id=contract.id)
+            if contract.event_created:
+                raise ValidationError(
+                    {'detail': 'an event already exists for this contract'})
+            serializer.save()
+            contract.event_created = True
+            contract.save(update_fields=['event_created', 'date_updated'])
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class EventViewset(ApiViewsetMixin, ModelViewSet):
+class EventViewset(FullTextSearchMixin, DeletedFeedMixin, ApiViewsetMixin,
+                   ModelViewSet):
     """
     Viewset for Events
     """
+    queryset = Event.objects.order_by('id')
     serializer_class = ListEventSerializer
     create_serializer_class = CreateEventSerializer
     detail_serializer_class = DetailEventSerializer
@@ -95,7 +496,265 @@ class EventViewset(ApiViewsetMixin, ModelViewSet):
     edit_permissions = [IsAuthenticated, perms.IsSupportReferee]
     create_permissions = [IsAuthenticated, perms.IsSales]
 
+    keyset_ordering = ('event_date', 'id')
+    validator_relations = ('customer',)
+    search_index = event_index
+
     filterset_class = EventFilter
 
-    def get_queryset(self):
-        return Event.objects.all()
+    # longest period returned by calendar, a quarter
+    calendar_max_days = 92
+
+    def get_serializer_class(self):
+        if self.action == 'calendar':
+            return CalendarEventSerializer
+        return super().get_serializer_class()
+
+    def get_calendar_period(self, request):
+        """
+        get the period of ?from= and ?to=, each being a year, a month or a
+        day, to included. Defaults to the current month.
+        :return: tuple of aware datetimes (start, end), end excluded
+        """
+        periods = {}
+        for param in ('from', 'to'):
+            value = request.query_params.get(param)
+            if value:
+                periods[param] = parse_period(value)
+                if periods[param] is None:
+                    raise ValidationError(
+                        {param: 'Expected a year, a month or a day'})
+        if 'from' in periods:
+            start = periods['from'][0]
+        else:
+            today = timezone.localdate()
+            start = get_period(today.year, today.month)[0]
+        if 'to' in periods:
+            end = periods['to'][1]
+        else:
+            local_start = timezone.localtime(start)
+            end = get_period(local_start.year, local_start.month)[1]
+        if end <= start:
+            raise ValidationError({'detail': 'to has to be after from'})
+        if end - start > timedelta(days=self.calendar_max_days):
+            raise ValidationError({'detail': f'the period can\'t exceed '
+                                             f'{self.calendar_max_days} days'})
+        return start, end
+
+    @action(detail=False, methods=['get'], url_path='calendar')
+    def calendar(self, request):
+        """
+        events of a period grouped by day with their attendees total, from
+        a single range query on event_date. Filters of list also apply, e.g.
+        ?support_contact=. With ?events=false only the daily totals are
+        returned, aggregated by the DB.
+        :return: Response with the days having events
+        """
+        start, end = self.get_calendar_period(request)
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            event_date__gte=start, event_date__lt=end)
+        tz = timezone.get_current_timezone()
+
+        if request.query_params.get('events') == 'false':
+            rows = queryset.order_by() \
+                .annotate(day=TruncDate('event_date', tzinfo=tz)) \
+                .values('day') \
+                .annotate(event_count=Count('id'),
+                          attendees=Sum('attendees')) \
+                .order_by('day')
+            days = [{'date': row['day'].isoformat(),
+                     'event_count': row['event_count'],
+                     'attendees': row['attendees'] or 0} for row in rows]
+        else:
+            events = list(queryset.order_by('event_date', 'id'))
+            data = self.get_serializer(events, many=True).data
+            days = []
+            for event, event_data in zip(events, data):
+                day = timezone.localtime(event.event_date, tz).date()
+                if not days or days[-1]['date'] != day.isoformat():
+                    days.append({'date': day.isoformat(), 'event_count': 0,
+                                 'attendees': 0, 'events': []})
+                days[-1]['event_count'] += 1
+                days[-1]['attendees'] += event.attendees
+                days[-1]['events'].append(event_data)
+
+        return Response({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'event_count': sum(day['event_count'] for day in days),
+            'attendees': sum(day['attendees'] for day in days),
+            'days': days,
+        })
+
+
+_search_executor = None
+_search_executor_lock = Lock()
+
+
+def get_search_executor():
+    """
+    function to get the thread pool shared by the search requests, sized
+    with API_SEARCH_CONCURRENCY
+    :return: ThreadPoolExecutor
+    """
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=settings.API_SEARCH_CONCURRENCY,
+                thread_name_prefix='api-search')
+        return _search_executor
+
+
+class SearchView(APIView):
+    """
+    View searching customers, contracts, events and, for managers, users
+    with a single ?q=. Each section runs in its own thread when
+    API_SEARCH_CONCURRENCY is above 1.
+    """
+    permission_classes = [IsAuthenticated]
+    section_limit = 5
+    max_section_limit = 20
+
+    def get_sections(self, request, text):
+        """
+        get the querysets searched and their serializer, the users section
+        follows the manager permission
+        :return: dict of (queryset, serializer class) by section name
+        """
+        sections = {
+            'customers': (
+                customer_index.search(Customer.objects.all(), text),
+                ListCustomersSerializer),
+            'contracts': (
+                customer_index.search(Contract.objects.all(), text,
+                                      'customer'),
+                ListContractSerializer),
+            'events': (
+                event_index.search(Event.objects.all(), text),
+                ListEventSerializer),
+        }
+        if perms.IsManager().has_permission(request, self):
+            users = CustomUser.objects.filter(is_superuser=False)
+            for term in text.split():
+                users = users.filter(
+                    Q(username__icontains=term)
+                    | Q(first_name__icontains=term)
+                    | Q(last_name__icontains=term)
+                    | Q(email__icontains=term))
+            sections['users'] = (users.order_by('id'),
+                                 DetailCustomUserSerializer)
+        return sections
+
+    def search_section(self, queryset, serializer_class, limit):
+        """
+        serialize the first results of a section
+        :return: tuple, serialized results, truncated boolean and duration
+        in milliseconds
+        """
+        start = perf_counter()
+        queryset = select_serializer_relations(queryset, serializer_class)
+        rows = list(queryset[:limit + 1])
+        data = serializer_class(rows[:limit], many=True).data
+        return data, len(rows) > limit, (perf_counter() - start) * 1000
+
+    def search_section_thread(self, *args):
+        """
+        search_section run in a worker thread, whose DB connection is
+        closed once obsolete as Django does between requests
+        """
+        close_old_connections()
+        try:
+            return self.search_section(*args)
+        finally:
+            close_old_connections()
+
+    def get(self, request):
+        text = request.query_params.get('q', '')
+        if not text.strip():
+            raise ValidationError({'q': 'This parameter is required'})
+        try:
+            limit = min(int(request.query_params['limit']),
+                        self.max_section_limit)
+        except (KeyError, ValueError):
+            limit = self.section_limit
+        limit = max(limit, 1)
+
+        start = perf_counter()
+        sections = self.get_sections(request, text)
+        if settings.API_SEARCH_CONCURRENCY > 1:
+            executor = get_search_executor()
+            futures = {
+                name: executor.submit(self.search_section_thread, queryset,
+                                      serializer_class, limit)
+                for name, (queryset, serializer_class) in sections.items()
+            }
+            outcomes = {name: future.result()
+                        for name, future in futures.items()}
+        else:
+            outcomes = {
+                name: self.search_section(queryset, serializer_class, limit)
+                for name, (queryset, serializer_class) in sections.items()
+            }
+
+        results, meta = {}, {}
+        for name, (data, truncated, duration) in outcomes.items():
+            results[name] = data
+            meta[name] = {'count': len(data), 'truncated': truncated,
+                          'ms': round(duration, 2)}
+        meta['total_ms'] = round((perf_counter() - start) * 1000, 2)
+        return Response({'query': text, 'results': results, 'meta': meta})
+
+
+class SalesDashboardView(APIView):
+    """
+    View returning the contracts aggregates of each sale contact from the
+    summary tables, so its cost depends on the number of sales users, not
+    of contracts. Sales users only get their own line, managers can filter
+    with ?sale_contact=.
+    """
+    permission_classes = [IsAuthenticated, perms.IsManager | perms.IsSales]
+    months = 6
+    max_months = 24
+
+    def get(self, request):
+        summaries = SalesSummary.objects.select_related('sale_contact') \
+            .order_by('sale_contact_id')
+        dues = SalesDueSummary.objects.filter(month__gte=get_month())
+        if perms.IsManager().has_permission(request, self):
+            sale_contact = request.query_params.get('sale_contact')
+            try:
+                sale_contact = int(sale_contact) if sale_contact else None
+            except ValueError:
+                raise ValidationError(
+                    {'sale_contact': 'A valid integer is required'})
+        else:
+            sale_contact = request.user.id
+        if sale_contact:
+            summaries = summaries.filter(sale_contact_id=sale_contact)
+            dues = dues.filter(sale_contact_id=sale_contact)
+        try:
+            months = min(int(request.query_params['months']),
+                         self.max_months)
+        except (KeyError, ValueError):
+            months = self.months
+
+        # open contracts, see get_open_contracts_filter
+        open_amounts = dict(
+            dues.order_by().values('sale_contact')
+            .annotate(total=Sum('amount'))
+            .values_list('sale_contact', 'total'))
+        upcoming_dues = defaultdict(list)
+        for due in dues.filter(month__lt=get_month(offset=months)) \
+                .order_by('month'):
+            upcoming_dues[due.sale_contact_id].append({
+                'month': due.month.strftime('%Y-%m'),
+                'contract_count': due.contract_count,
+                'amount': due.amount,
+            })
+        for summary in summaries:
+            summary.open_amount = open_amounts.get(summary.sale_contact_id,
+                                                   0)
+            summary.upcoming_dues = upcoming_dues[summary.sale_contact_id]
+        serializer = SalesSummarySerializer(summaries, many=True)
+        return Response(serializer.data)
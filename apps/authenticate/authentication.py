@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, \
+    InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import aware_utcnow
+from .models import CustomUser
+
+
+TOKEN_VERSION_KEY = 'token_version:{}'
+# seconds a token version is trusted from the cache, bounding how long a
+# revoked token is accepted by processes not sharing the cache
+TOKEN_VERSION_TIMEOUT = 60
+
+
+def get_token_version(user_id):
+    """
+    function to get a user's token_version, from the cache when possible
+    :param user_id: int, user pk
+    :return: int
+    """
+    key = TOKEN_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = CustomUser.objects.filter(id=user_id, is_active=True) \
+            .values_list('token_version', flat=True).first()
+        if version is None:
+            raise AuthenticationFailed('User not found',
+                                       code='user_not_found')
+        cache.set(key, version, TOKEN_VERSION_TIMEOUT)
+    return version
+
+
+def forget_token_versions(user_ids):
+    """
+    function to remove users' token_version from the cache
+    :param user_ids: iterable of users pk
+    """
+    cache.delete_many([TOKEN_VERSION_KEY.format(id) for id in user_ids])
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of the tokens whose signature was already verified,
+    keyed by the raw token
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.tokens = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, raw_token):
+        with self.lock:
+            token = self.tokens.get(raw_token)
+            if token is not None:
+                self.tokens.move_to_end(raw_token)
+            return token
+
+    def set(self, raw_token, token):
+        with self.lock:
+            self.tokens[raw_token] = token
+            self.tokens.move_to_end(raw_token)
+            if len(self.tokens) > self.maxsize:
+                self.tokens.popitem(last=False)
+
+    def discard(self, raw_token):
+        with self.lock:
+            self.tokens.pop(raw_token, None)
+
+
+verified_tokens = VerifiedTokenCache(
+    getattr(settings, 'JWT_VERIFIED_TOKENS_CACHE_SIZE', 1024))
+
+
+class CachedTokenMixin:
+    """
+    Mixin skipping the signature verification of tokens already verified,
+    their expiration is still checked on each request
+    """
+    def get_validated_token(self, raw_token):
+        token = verified_tokens.get(raw_token)
+        if token is not None:
+            try:
+                token.check_exp(current_time=aware_utcnow())
+                return token
+            except TokenError:
+                verified_tokens.discard(raw_token)
+        token = super().get_validated_token(raw_token)
+        verified_tokens.set(raw_token, token)
+        return token
+
+
+def check_token_version(validated_token, version):
+    """
+    function refusing a token without token_version claim, or issued before
+    the last change of the user's roles
+    :param validated_token: Token
+    :param version: int, current token_version of the user
+    """
+    if 'token_version' not in validated_token:
+        raise InvalidToken('Token contained no token version')
+    if validated_token['token_version'] != version:
+        raise AuthenticationFailed('Token issued before a change of '
+                                   'the user roles',
+                                   code='token_not_valid')
+
+
+class VersionedJWTAuthentication(CachedTokenMixin, JWTAuthentication):
+    """
+    JWT authentication refusing tokens issued before the last change of the
+    user's roles, by comparing the token_version claim with the user's one
+    """
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_token_version(validated_token, user.token_version)
+        return user
+
+
+class LazyTokenUser:
+    """
+    User built from the access token claims (id, username, roles). The
+    CustomUser row is only loaded when an attribute not carried by the
+    token is accessed.
+    """
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[api_settings.USER_ID_CLAIM]
+
+    def __str__(self):
+        return self.username
+
+    def __eq__(self, other):
+        return self.id == getattr(other, 'id', None)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+
+    @cached_property
+    def user(self):
+        return CustomUser.objects.get(id=self.id)
+
+    @cached_property
+    def username(self):
+        if 'username' in self.token:
+            return self.token['username']
+        return self.user.username
+
+    def get_roles(self):
+        if 'roles' in self.token:
+            return frozenset(self.token['roles'])
+        return self.user.get_roles()
+
+    def is_manager(self):
+        return CustomUser.MANAGER in self.get_roles()
+
+    def is_sales(self):
+        return CustomUser.SALES in self.get_roles()
+
+    def is_support(self):
+        return CustomUser.SUPPORT in self.get_roles()
+
+
+class StatelessJWTAuthentication(CachedTokenMixin, JWTAuthentication):
+    """
+    JWT authentication building a LazyTokenUser from the token claims
+    instead of loading the user from the DB. Revoked tokens are detected
+    with the token_version kept in the cache.
+    """
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user '
+                               'identification')
+        if 'token_version' not in validated_token:
+            raise InvalidToken('Token contained no token version')
+        check_token_version(
+            validated_token,
+            get_token_version(validated_token[api_settings.USER_ID_CLAIM]))
+        return LazyTokenUser(validated_token)
@@ -19,15 +19,29 @@ class CustomUser(AbstractUser):
     phone = models.CharField(max_length=20)
     mobile = models.CharField(max_length=20, null=True)
     role = models.CharField(max_length=16, choices=ROLE_LIST, default=SUPPORT)
+    # incremented when the user's groups change, to revoke tokens holding
+    # the previous roles
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    def get_roles(self):
+        """
+        get the names of the user's groups, queried once per user object so
+        a request shares them between views, templates and permissions
+        :return: frozenset of groups' name
+        """
+        if not hasattr(self, '_roles'):
+            self._roles = frozenset(
+                self.groups.values_list('name', flat=True))
+        return self._roles
+
     def is_manager(self):
-        return self.groups.filter(name='manager').exists()
+        return self.MANAGER in self.get_roles()
 
     def is_sales(self):
-        return self.groups.filter(name='sales').exists()
+        return self.SALES in self.get_roles()
 
     def is_support(self):
-        return self.groups.filter(name='support').exists()
\ No newline at end of file
+        return self.SUPPORT in self.get_roles()
\ No newline at end of file
@@ -3,6 +3,11 @@ from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.models import Group
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, \
+    TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import check_token_version, get_token_version
 from .models import CustomUser
 
 
@@ -73,3 +78,29 @@ class ChangePasswordSerializer(Serializer):
     def validate_new_password(self, value):
         validate_password(value)
         return value
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Token serializer adding the user's username, roles and token version
+    as claims
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['roles'] = [group.name for group in user.groups.all()]
+        token['token_version'] = user.token_version
+        return token
+
+
+class VersionedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh serializer refusing refresh tokens of inactive users, or
+    issued before the last change of the user's roles
+    """
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        check_token_version(refresh, get_token_version(
+            refresh[api_settings.USER_ID_CLAIM]))
+        return super().validate(attrs)
@@ -0,0 +1,65 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
+from .authentication import forget_token_versions
+from .models import CustomUser
+
+
+# fields whose change revokes the user's tokens
+TOKEN_FIELDS = ('role', 'is_active')
+
+
+def revoke_tokens(user_ids):
+    """
+    function incrementing the token_version of users, so the tokens issued
+    before are refused
+    :param user_ids: list of users pk
+    """
+    CustomUser.objects.filter(id__in=user_ids) \
+        .update(token_version=F('token_version') + 1)
+    forget_token_versions(user_ids)
+
+
+@receiver(pre_save, sender=CustomUser)
+def user_saving(sender, instance, raw, update_fields, **kwargs):
+    """
+    flag an updated user whose role or active status changed
+    """
+    instance._revoke_tokens = False
+    if raw or instance.pk is None or (
+            update_fields is not None
+            and not set(update_fields) & set(TOKEN_FIELDS)):
+        return
+    stored = CustomUser.objects.filter(pk=instance.pk) \
+        .values(*TOKEN_FIELDS).first()
+    instance._revoke_tokens = stored is not None and any(
+        stored[field] != getattr(instance, field) for field in TOKEN_FIELDS)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, **kwargs):
+    """
+    revoke the tokens of a user whose role or active status changed
+    """
+    if getattr(instance, '_revoke_tokens', False):
+        revoke_tokens([instance.id])
+        instance.refresh_from_db(fields=['token_version'])
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    increment the token_version of users whose groups changed, so the
+    tokens holding their previous roles are refused
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # forget the roles memoized by CustomUser.get_roles
+        instance.__dict__.pop('_roles', None)
+        user_ids = [instance.id]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('id', flat=True))
+    else:
+        user_ids = list(pk_set)
+    revoke_tokens(user_ids)
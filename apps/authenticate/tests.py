@@ -1,3 +1,233 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, \
+    InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .authentication import LazyTokenUser, StatelessJWTAuthentication, \
+    VersionedJWTAuthentication, verified_tokens
+from .models import CustomUser
+from .serializers import RoleTokenObtainPairSerializer
 
-# Create your tests here.
+
+class AuthenticationTestMixin:
+    """
+    Mixin creating the groups and a sales user, with helpers issuing its
+    tokens
+    """
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('manager', 'sales', 'support'):
+            Group.objects.create(name=name)
+        cls.user = CustomUser.objects.create(
+            username='sales@test.test', email='sales@test.test',
+            role='sales')
+        cls.user.set_password('password')
+        cls.user.save()
+        cls.user.groups.add(Group.objects.get(name='sales'))
+
+    def setUp(self):
+        # token versions kept by a previous test
+        cache.clear()
+        self.user.refresh_from_db()
+
+    def get_tokens(self):
+        """
+        :return: tuple, raw access and refresh tokens issued at login
+        """
+        refresh = RoleTokenObtainPairSerializer.get_token(self.user)
+        return str(refresh.access_token), str(refresh)
+
+    def authenticate(self, authentication_class, raw_token):
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {raw_token}')
+        return authentication_class().authenticate(request)
+
+
+class RoleClaimsTest(AuthenticationTestMixin, TestCase):
+    """
+    Test that the tokens carry the user's roles and are refused once they
+    changed
+    """
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def get_token_version(self):
+        return CustomUser.objects.get(pk=self.user.pk).token_version
+
+    def refresh(self, refresh):
+        return self.client.post('/api/login/refresh/', {'refresh': refresh})
+
+    def get_users(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.get('/api/users/')
+
+    def test_login_claims(self):
+        response = self.client.post('/api/login/', {
+            'username': 'sales@test.test', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        for token in (AccessToken(response.data['access']),
+                      RefreshToken(response.data['refresh'])):
+            self.assertEqual(token['username'], 'sales@test.test')
+            self.assertEqual(token['roles'], ['sales'])
+            self.assertEqual(token['token_version'], self.user.token_version)
+
+        response = self.refresh(response.data['refresh'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['roles'],
+                         ['sales'])
+
+    def test_role_change(self):
+        access, refresh = self.get_tokens()
+        self.assertEqual(self.get_users(access).status_code, 200)
+        self.user.role = CustomUser.SUPPORT
+        self.user.save()
+        self.assertEqual(self.get_users(access).status_code, 401)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_group_change(self):
+        access, refresh = self.get_tokens()
+        self.user.groups.set([Group.objects.get(name='support')])
+        self.assertEqual(self.get_users(access).status_code, 401)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+        # tokens issued with the new version
+        self.user.refresh_from_db()
+        access, refresh = self.get_tokens()
+        self.assertEqual(self.get_users(access).status_code, 200)
+        self.assertEqual(self.refresh(refresh).status_code, 200)
+
+    def test_inactive_user(self):
+        _, refresh = self.get_tokens()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_token_version_bump(self):
+        version = self.get_token_version()
+        self.user.role = CustomUser.MANAGER
+        self.user.save()
+        self.assertEqual(self.get_token_version(), version + 1)
+        self.assertEqual(self.user.token_version, version + 1)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_token_version(), version + 2)
+        self.user.groups.add(Group.objects.get(name='manager'))
+        self.assertEqual(self.get_token_version(), version + 3)
+        self.user.groups.remove(Group.objects.get(name='manager'))
+        self.assertEqual(self.get_token_version(), version + 4)
+        Group.objects.get(name='sales').user_set.clear()
+        self.assertEqual(self.get_token_version(), version + 5)
+
+    def test_no_token_version_bump(self):
+        version = self.get_token_version()
+        self.user.first_name = 'first'
+        self.user.save()
+        # the last_login update of each login runs no extra query
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.get_token_version(), version)
+
+
+class TokenVersionTest(AuthenticationTestMixin, TestCase):
+    """
+    Test that both authentication classes refuse revoked tokens, even once
+    their signature is cached
+    """
+    authentication_classes = (VersionedJWTAuthentication,
+                              StatelessJWTAuthentication)
+
+    def test_revoked_cached_token(self):
+        for authentication_class in self.authentication_classes:
+            with self.subTest(authentication_class.__name__):
+                self.user.refresh_from_db()
+                access, _ = self.get_tokens()
+                user, _ = self.authenticate(authentication_class, access)
+                self.assertEqual(user.id, self.user.id)
+                self.assertIsNotNone(verified_tokens.get(access.encode()))
+
+                self.user.groups.add(Group.objects.get(name='support'))
+                self.assertIsNotNone(verified_tokens.get(access.encode()))
+                with self.assertRaises(AuthenticationFailed):
+                    self.authenticate(authentication_class, access)
+
+    def test_token_without_version(self):
+        # issued by the default simplejwt view, without token_version claim
+        access = str(AccessToken.for_user(self.user))
+        for authentication_class in self.authentication_classes:
+            with self.subTest(authentication_class.__name__):
+                with self.assertRaises(InvalidToken):
+                    self.authenticate(authentication_class, access)
+
+    def test_revoked_token_request(self):
+        client = APIClient()
+        access, _ = self.get_tokens()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(client.get('/api/users/').status_code, 200)
+        self.user.groups.remove(Group.objects.get(name='sales'))
+        self.assertEqual(client.get('/api/users/').status_code, 401)
+
+
+class StatelessAuthenticationTest(AuthenticationTestMixin, TestCase):
+    """
+    Test that StatelessJWTAuthentication builds the user from the token
+    """
+    def test_no_user_query(self):
+        access, _ = self.get_tokens()
+        # the token version is then read from the cache
+        self.authenticate(StatelessJWTAuthentication, access)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(StatelessJWTAuthentication, access)
+            self.assertIsInstance(user, LazyTokenUser)
+            self.assertEqual(user, self.user)
+            self.assertEqual(user.username, 'sales@test.test')
+            self.assertEqual(user.get_roles(), frozenset({'sales'}))
+            self.assertTrue(user.is_sales())
+            self.assertFalse(user.is_manager())
+            self.assertTrue(user.is_authenticated)
+
+    def test_lazy_user(self):
+        access, _ = self.get_tokens()
+        user = LazyTokenUser(AccessToken(access))
+        # attributes missing from the token load the user once
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'sales@test.test')
+            self.assertEqual(user.role, 'sales')
+        self.assertEqual(str(user), 'sales@test.test')
+        self.assertEqual(hash(user), hash(self.user.id))
+
+    def test_lazy_user_without_claims(self):
+        user = LazyTokenUser(AccessToken.for_user(self.user))
+        with self.assertNumQueries(2):
+            self.assertEqual(user.username, 'sales@test.test')
+            self.assertEqual(user.get_roles(), frozenset({'sales'}))
+
+
+class RolesMemoTest(AuthenticationTestMixin, TestCase):
+    """
+    Test that CustomUser.get_roles queries the groups once per user object
+    """
+    def test_get_roles_queries(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.get_roles(), frozenset({'sales'}))
+            self.assertTrue(user.is_sales())
+            self.assertFalse(user.is_manager())
+            self.assertFalse(user.is_support())
+            self.assertEqual(user.get_roles(), frozenset({'sales'}))
+
+    def test_group_change_forgets_roles(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.get_roles()
+        user.groups.add(Group.objects.get(name='manager'))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_manager())
+            self.assertTrue(user.is_sales())
+
+    def test_roles_per_user_object(self):
+        CustomUser.objects.get(pk=self.user.pk).get_roles()
+        user = CustomUser.objects.get(pk=self.user.pk)
+        # another object of the same user queries its own groups
+        with self.assertNumQueries(1):
+            user.get_roles()
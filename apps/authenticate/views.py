@@ -2,13 +2,30 @@ from rest_framework.generics import CreateAPIView
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import RegistrationSerializer, DetailCustomUserSerializer, \
-    ChangePasswordSerializer
+    ChangePasswordSerializer, RoleTokenObtainPairSerializer, \
+    VersionedTokenRefreshSerializer
 from apps.authenticate.models import CustomUser
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated
 import P12_backend.permissions as perms
 from rest_framework.exceptions import MethodNotAllowed
 from .filters import UserFilter
+from rest_framework_simplejwt.views import TokenObtainPairView, \
+    TokenRefreshView
+
+
+class RoleTokenObtainPairView(TokenObtainPairView):
+    """
+    View delivering tokens holding the user's roles
+    """
+    serializer_class = RoleTokenObtainPairSerializer
+
+
+class VersionedTokenRefreshView(TokenRefreshView):
+    """
+    View refreshing the access token of users whose roles didn't change
+    """
+    serializer_class = VersionedTokenRefreshSerializer
 
 
 class RegisterView(CreateAPIView):
@@ -39,7 +56,7 @@ class UserViewset(ModelViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
-        return CustomUser.objects.filter(is_superuser=False)
+        return CustomUser.objects.filter(is_superuser=False).order_by('id')
 
     def create(self, request, *args, **kwargs):
         """
@@ -0,0 +1,248 @@
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import resolve, Resolver404
+from django.utils.module_loading import import_string
+from apps.API.cache import LRUCacheBackend
+import json
+import requests
+
+
+def get_api_url():
+    """
+    function to get the API root url from settings
+    :return: string, API url ending with a slash
+    """
+    return settings.FRONT_API['URL']
+
+
+def get_transport():
+    """
+    function to get the transport selected in settings.FRONT_API
+    :return: transport instance
+    """
+    path = settings.FRONT_API['TRANSPORT']
+    if path not in _transports:
+        _transports[path] = import_string(path)()
+    return _transports[path]
+
+
+_transports = {}
+
+
+class CachedResponse:
+    """
+    Response rebuilt from the validator cache when the API answered 304 Not
+    Modified, exposing the same interface as the transports responses
+    """
+    status_code = 200
+    ok = True
+
+    def __init__(self, data, headers):
+        self.data = data
+        self.headers = headers
+
+    def json(self):
+        return self.data
+
+
+class ValidatorCacheMixin:
+    """
+    Mixin keeping the last GET responses carrying an ETag, by user and url,
+    in a bounded LRU. The next GET of the same url sends If-None-Match and
+    the cached data is returned when the API answers 304, so unchanged lists
+    and details are neither serialized by the API nor parsed by the front.
+    The size is set by FRONT_API['VALIDATOR_CACHE_SIZE'], 0 disables it.
+    """
+    def __init__(self):
+        size = settings.FRONT_API.get('VALIDATOR_CACHE_SIZE', 0)
+        self.validator_cache = LRUCacheBackend(size) if size else None
+
+    def get_cache_key(self, request, method, url):
+        """
+        :return: tuple, None when the response is not cached
+        """
+        user = getattr(request, 'user', None)
+        if self.validator_cache is None or method.upper() != 'GET' \
+                or user is None or not user.is_authenticated:
+            return None
+        return user.pk, url
+
+    def send(self, request, method, url, body=None):
+        """
+        send a request to the API, conditionally for cached GET responses
+        :param request: http request from view
+        :param method: string, http method
+        :param url: absolute API url
+        :param body: dict with data to send to the API
+        :return: transport response or CachedResponse
+        """
+        key = self.get_cache_key(request, method, url)
+        if key is None:
+            return self.send_request(request, method, url, body)
+        cached = self.validator_cache.get_many([key]).get(key)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        response = self.send_request(request, method, url, body, headers)
+        if response.status_code == 304 and cached:
+            return CachedResponse(cached[1], response.headers)
+        etag = response.headers.get('ETag')
+        if response.status_code != 200 or not etag:
+            return response
+        data = response.json()
+        self.validator_cache.set_many({key: (etag, data)})
+        return CachedResponse(data, response.headers)
+
+
+class HttpTransport(ValidatorCacheMixin):
+    """
+    Transport sending requests to the API over HTTP, with the access token
+    stored in the user's cookies
+    """
+    def headers(self, request):
+        token = request.COOKIES.get('access')
+        return {'Authorization': 'Bearer ' + str(token)}
+
+    def send_request(self, request, method, url, body=None, headers=None):
+        """
+        send a request to the API
+        :param request: http request from view
+        :param method: string, http method
+        :param url: absolute API url
+        :param body: dict with data to send to the API
+        :param headers: dict of extra request headers
+        :return: requests response
+        """
+        return requests.request(method, url=url, data=body,
+                                headers={**self.headers(request),
+                                         **(headers or {})})
+
+
+class InProcessResponse:
+    """
+    Response returned by InProcessTransport, exposing the same interface
+    as the requests responses used by the front views
+    """
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        """
+        :return: the data returned by the API view, without rendering it to
+        JSON and parsing it back
+        """
+        if hasattr(self.response, 'data'):
+            return self.response.data
+        return json.loads(self.response.content)
+
+
+class InProcessTransport(ValidatorCacheMixin):
+    """
+    Transport dispatching requests straight to the API views in the current
+    process. The user of the front request is forced as the authenticated
+    API user, so no socket is opened and no token is verified.
+    """
+    def build_request(self, request, method, path, query, body,
+                      headers=None):
+        """
+        build a WSGI request targeting an API view
+        :param request: http request from view
+        :param method: string, http method
+        :param path: string, url path
+        :param query: string, url query
+        :param body: dict with data to send to the API
+        :param headers: dict of extra request headers
+        :return: WSGIRequest
+        """
+        payload = urlencode(self.encode_body(body), doseq=True).encode()
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(payload)),
+            'wsgi.input': BytesIO(payload),
+            'wsgi.url_scheme': request.scheme,
+        }
+        # the API is served by this process, so the front request's host is
+        # used for the links built by the API views
+        for key in ('SERVER_NAME', 'SERVER_PORT', 'HTTP_HOST'):
+            if key in request.META:
+                environ[key] = request.META[key]
+        for name, value in (headers or {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        api_request = WSGIRequest(environ)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            api_request._force_auth_user = user
+        return api_request
+
+    def encode_body(self, body):
+        """
+        encode a body the same way requests does for form data, skipping
+        None values
+        :param body: dict with data to send to the API
+        :return: list of (key, value) tuples
+        """
+        if not body:
+            return []
+        items = []
+        for key, value in body.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            for item in values:
+                if item is not None:
+                    items.append((key, str(item)))
+        return items
+
+    def resolve(self, path):
+        """
+        resolve a path the way CommonMiddleware does, appending a trailing
+        slash when needed
+        :param path: string, url path
+        :return: tuple (path, ResolverMatch) or (path, None)
+        """
+        for candidate in (path, path + '/'):
+            try:
+                return candidate, resolve(candidate)
+            except Resolver404:
+                continue
+        return path, None
+
+    def send_request(self, request, method, url, body=None, headers=None):
+        """
+        send a request to the API view matching url
+        :param request: http request from view
+        :param method: string, http method
+        :param url: absolute API url
+        :param body: dict with data to send to the API
+        :param headers: dict of extra request headers
+        :return: InProcessResponse
+        """
+        parts = urlsplit(url)
+        path, match = self.resolve(parts.path)
+        if match is None:
+            return NotFoundResponse()
+        api_request = self.build_request(request, method.upper(), path,
+                                         parts.query, body, headers)
+        response = match.func(api_request, *match.args, **match.kwargs)
+        return InProcessResponse(response)
+
+
+class NotFoundResponse:
+    """
+    Response returned when no API view match the requested url
+    """
+    status_code = 404
+    ok = False
+    headers = {}
+
+    def json(self):
+        return {'detail': 'Not found.'}
@@ -0,0 +1,29 @@
+from threading import Lock
+from apps.API.cache import USER_CHOICES_VERSION_KEY, get_version
+from apps.authenticate.models import CustomUser
+
+
+_choices = {}
+_choices_lock = Lock()
+
+
+def get_role_choices(role):
+    """
+    function to get the (id, email) choices of the users having a role, the
+    same users as the API's users?role=, kept in memory until a user change
+    gives the choices a new version
+    :param role: string, CustomUser role
+    :return: list of tuples
+    """
+    version = get_version(USER_CHOICES_VERSION_KEY)
+    with _choices_lock:
+        cached = _choices.get(role)
+        if cached is not None and cached[0] == version:
+            return list(cached[1])
+    choices = list(
+        CustomUser.objects.filter(role=role, is_superuser=False)
+        .order_by('id').values_list('id', 'email'))
+    with _choices_lock:
+        _choices[role] = (version, choices)
+    return list(choices)
+
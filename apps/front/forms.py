@@ -4,17 +4,12 @@ from apps.authenticate.models import CustomUser
 
 class CustomerForm(forms.Form):
     """
-    Customer creation form, wich take a dict as an argmuent to display sales
-    users return from API
+    Customer creation form, wich take the (id, email) choices of the sales
+    users as an argument
     """
     def __init__(self, sales=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sales_choices = []
-        for employee in sales:
-            id = int(employee['id'])
-            mail = employee['email']
-            user_data = (id, mail)
-            self.sales_choices.append(user_data)
+        self.sales_choices = list(sales or [])
         self.fields['sale_contact'] = forms.ChoiceField(
             choices=self.sales_choices)
 
@@ -30,17 +25,12 @@ class CustomerForm(forms.Form):
 
 class CustomerEditForm(forms.Form):
     """
-    Customer edit form, wich take a dict as an argmuent to display sales
-    users return from API
+    Customer edit form, wich take the (id, email) choices of the sales
+    users as an argument
     """
     def __init__(self, sales, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sales_choices = []
-        for employee in sales:
-            id = int(employee['id'])
-            mail = employee['email']
-            user_data = (id, mail)
-            self.sales_choices.append(user_data)
+        self.sales_choices = list(sales)
         self.fields['sale_contact'] = forms.ChoiceField(
             choices=self.sales_choices)
 
@@ -55,17 +45,12 @@ class CustomerEditForm(forms.Form):
 
 class ContractForm(forms.Form):
     """
-    Contract creation form, wich take a dict as an argmuent to display sales
-    users return from API
+    Contract creation form, wich take the (id, email) choices of the sales
+    users as an argument
     """
     def __init__(self, sales, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sales_choices = []
-        for employee in sales:
-            id = int(employee['id'])
-            mail = employee['email']
-            user_data = (id, mail)
-            self.sales_choices.append(user_data)
+        self.sales_choices = list(sales)
         self.fields['sale_contact'] = forms.ChoiceField(
             choices=self.sales_choices)
 
@@ -77,17 +62,12 @@ class ContractForm(forms.Form):
 
 class ContractEditForm(forms.Form):
     """
-    Contract edition form, wich take a dict as an argmuent to display sales
-    users return from API
+    Contract edition form, wich take the (id, email) choices of the sales
+    users as an argument
     """
     def __init__(self, sales, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sales_choices = []
-        for employee in sales:
-            id = int(employee['id'])
-            mail = employee['email']
-            user_data = (id, mail)
-            self.sales_choices.append(user_data)
+        self.sales_choices = list(sales)
         self.fields['sale_contact'] = forms.ChoiceField(
             choices=self.sales_choices)
 
@@ -100,17 +80,12 @@ class ContractEditForm(forms.Form):
 
 class EventForm(forms.Form):
     """
-    Event creation form, wich take a dict as an argmuent to display support
-    users return from API
+    Event creation form, wich take the (id, email) choices of the support
+    users as an argument
     """
     def __init__(self, support, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.support_choices = []
-        for employee in support:
-            id = int(employee['id'])
-            mail = employee['email']
-            user_data = (id, mail)
-            self.support_choices.append(user_data)
+        self.support_choices = list(support)
         self.fields['support_contact'] = forms.ChoiceField(
             choices=self.support_choices)
 
@@ -122,17 +97,12 @@ class EventForm(forms.Form):
 
 class EventEditForm(forms.Form):
     """
-    Event creation form, wich take a dict as an argmuent to display support
-    users return from API
+    Event creation form, wich take the (id, email) choices of the support
+    users as an argument
     """
     def __init__(self, support, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.support_choices = []
-        for employee in support:
-            id = int(employee['id'])
-            mail = employee['email']
-            user_data = (id, mail)
-            self.support_choices.append(user_data)
+        self.support_choices = list(support)
         self.fields['support_contact'] = forms.ChoiceField(
             choices=self.support_choices)
 
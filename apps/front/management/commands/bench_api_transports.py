@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from apps.authenticate.models import CustomUser
+from apps.authenticate.serializers import RoleTokenObtainPairSerializer
+from P12_backend.benchmark import percentile
+from time import perf_counter
+from urllib.parse import urlsplit
+
+
+TRANSPORTS = {
+    'http': 'apps.front.api_client.HttpTransport',
+    'inprocess': 'apps.front.api_client.InProcessTransport',
+}
+
+
+class Command(BaseCommand):
+    """
+    Command measuring front pages latency for each API transport.
+    The http transport needs the API server to be running at
+    FRONT_API['URL'].
+    """
+    help = 'Compare p50/p99 front page latency for each API transport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--pages', nargs='+',
+                            default=['customers', 'contracts', 'events'])
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--transports', nargs='+',
+                            choices=list(TRANSPORTS),
+                            default=list(TRANSPORTS))
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['username'])
+        except CustomUser.DoesNotExist:
+            raise CommandError('Unknown user ' + options['username'])
+
+        client = Client(HTTP_HOST=urlsplit(settings.FRONT_API['URL']).netloc)
+        client.force_login(user)
+        client.cookies['access'] = str(
+            RoleTokenObtainPairSerializer.get_token(user).access_token)
+
+        for name in options['transports']:
+            front_api = dict(settings.FRONT_API, TRANSPORT=TRANSPORTS[name])
+            with override_settings(FRONT_API=front_api):
+                for page in options['pages']:
+                    timings = self.measure(client, reverse(page),
+                                           options['iterations'])
+                    self.stdout.write(
+                        f'{name:<10} {page:<12} '
+                        f'p50={percentile(timings, 50) * 1000:.1f}ms '
+                        f'p99={percentile(timings, 99) * 1000:.1f}ms')
+
+    def measure(self, client, url, iterations):
+        """
+        request a front page several times
+        :param client: logged in test client
+        :param url: front page url
+        :param iterations: int, number of requests
+        :return: sorted list of latencies in seconds
+        """
+        timings = []
+        for _ in range(iterations):
+            start = perf_counter()
+            response = client.get(url)
+            timings.append(perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+        return sorted(timings)
@@ -1,3 +1,296 @@
-from django.test import TestCase
+from datetime import date
+from django.contrib.auth.models import AnonymousUser, Group
+from django.test import RequestFactory, TestCase, override_settings
+from unittest import mock
+from apps.API.models import Contract, Customer
+from apps.authenticate.models import CustomUser
+from apps.front.api_client import InProcessTransport, NotFoundResponse, \
+    get_api_url
+from apps.front.choices import get_role_choices
+from apps.front.views import ApiResults, get_api_mixin, get_api_page, \
+    get_remaining_pages
 
-# Create your tests here.
+
+class RoleChoicesTest(TestCase):
+    """
+    Test that the users choices of the forms are kept in memory until a
+    user change
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = CustomUser.objects.create(username='sales@test.test',
+                                              email='sales@test.test',
+                                              role='sales')
+
+    def test_choices_cached_until_user_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create(username='other@test.test',
+                                      email='other@test.test', role='sales')
+        choices = get_role_choices('sales')
+        self.assertEqual([email for id, email in choices],
+                         ['sales@test.test', 'other@test.test'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_role_choices('sales'), choices)
+
+        # a login only saves last_login
+        self.sales.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            get_role_choices('sales')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sales.email = 'renamed@test.test'
+            self.sales.save()
+        self.assertEqual(get_role_choices('sales')[0],
+                         (self.sales.id, 'renamed@test.test'))
+
+
+class InProcessTransportTest(TestCase):
+    """
+    Test that InProcessTransport builds the API requests the way requests
+    and the middlewares would
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='sales@test.test',
+                                             email='sales@test.test',
+                                             role='sales')
+
+    def setUp(self):
+        self.transport = InProcessTransport()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_form_body(self):
+        body = {'company': 'company', 'mobile': None,
+                'sale_contact': self.user.id, 'ids': [1, None, 2]}
+        self.assertEqual(self.transport.encode_body(body), [
+            ('company', 'company'), ('sale_contact', str(self.user.id)),
+            ('ids', '1'), ('ids', '2')])
+        self.assertEqual(self.transport.encode_body(None), [])
+        api_request = self.transport.build_request(
+            self.request, 'POST', '/api/customers/', '', body)
+        self.assertEqual(api_request.POST.getlist('ids'), ['1', '2'])
+        self.assertNotIn('mobile', api_request.POST)
+
+    def test_trailing_slash(self):
+        path, match = self.transport.resolve('/api/customers')
+        self.assertEqual(path, '/api/customers/')
+        self.assertIsNotNone(match)
+        response = self.transport.send_request(
+            self.request, 'get', get_api_url() + 'customers?limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_unknown_url(self):
+        response = self.transport.send_request(
+            self.request, 'GET', get_api_url() + 'unknown/')
+        self.assertIsInstance(response, NotFoundResponse)
+        self.assertFalse(response.ok)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+    def test_forced_user(self):
+        api_request = self.transport.build_request(
+            self.request, 'GET', '/api/customers/', '', None)
+        self.assertEqual(api_request._force_auth_user, self.user)
+        url = get_api_url() + 'customers/'
+        self.assertEqual(
+            self.transport.send_request(self.request, 'GET', url).status_code,
+            200)
+        self.request.user = AnonymousUser()
+        api_request = self.transport.build_request(
+            self.request, 'GET', '/api/customers/', '', None)
+        self.assertFalse(hasattr(api_request, '_force_auth_user'))
+        self.assertEqual(
+            self.transport.send_request(self.request, 'GET', url).status_code,
+            401)
+
+
+class ValidatorCacheTest(TestCase):
+    """
+    Test that the transports revalidate the API responses they keep
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='sales@test.test',
+                                             email='sales@test.test',
+                                             role='sales')
+        Customer.objects.create(first_name='first', last_name='last',
+                                phone='0102', email='customer@test.test',
+                                company='company')
+
+    def test_not_modified_served_from_cache(self):
+        transport = InProcessTransport()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        url = get_api_url() + 'customers/'
+        data = transport.send(request, 'GET', url).json()
+        data['results'].clear()
+        # only the validators are computed, the page isn't fetched
+        with self.assertNumQueries(1):
+            response = transport.send(request, 'GET', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['company'], 'company')
+
+        customer = Customer.objects.get()
+        customer.company = 'renamed'
+        customer.save()
+        response = transport.send(request, 'GET', url)
+        self.assertEqual(response.json()['results'][0]['company'], 'renamed')
+
+
+class SearchPageTest(TestCase):
+    """
+    Test the sections of the search page in "all" mode
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create(
+            username='manager@test.test', email='manager@test.test',
+            role='manager')
+        cls.manager.groups.add(Group.objects.create(name='manager'))
+        CustomUser.objects.create(username='support@test.test',
+                                  email='support@test.test', role='support',
+                                  first_name='Jane', last_name='Support')
+        Customer.objects.create(first_name='first', last_name='last',
+                                phone='0102', email='support@company.test',
+                                company='company', sale_contact=cls.manager)
+
+    @override_settings(API_SEARCH_CONCURRENCY=1)
+    def test_all_sections(self):
+        self.client.force_login(self.manager)
+        response = self.client.get('/search/', {'search_sel': 'all',
+                                                'search_input': 'support'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<h3>Clients</h3>')
+        self.assertContains(response, '<h3>Utilisateurs</h3>')
+        self.assertContains(response, 'Email : support@test.test')
+        self.assertNotContains(response, 'Aucuns résultats')
+
+
+class EventCreatePageTest(TestCase):
+    """
+    Test that the event form is shown again with the API error when the
+    contract already has an event
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.sales = CustomUser.objects.create(username='sales@test.test',
+                                              email='sales@test.test',
+                                              role='sales')
+        cls.sales.groups.add(Group.objects.create(name='sales'))
+        cls.support = CustomUser.objects.create(
+            username='support@test.test', email='support@test.test',
+            role='support')
+        customer = Customer.objects.create(
+            first_name='first', last_name='last', phone='0102',
+            email='customer@test.test', company='company',
+            sale_contact=cls.sales)
+        cls.contract = Contract.objects.create(
+            customer=customer, sale_contact=cls.sales, amount=10,
+            payement_due=date(2022, 1, 1))
+
+    def test_second_event_refused(self):
+        self.client.force_login(self.sales)
+        url = f'/event/{self.contract.id}/{self.contract.customer_id}/create/'
+        data = {'support_contact': self.support.id, 'attendees': 10,
+                'event_date': '2022-02-01T20:00', 'note': 'note'}
+        response = self.client.post(url, data)
+        event = self.contract.event_set.get()
+        self.assertRedirects(response, f'/event/{event.id}/',
+                             fetch_redirect_response=False)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response,
+                            'an event already exists for this contract')
+        self.assertEqual(self.contract.event_set.count(), 1)
+
+
+class RemainingPagesTest(TestCase):
+    """
+    Test that the pages following the first one are listed only when the
+    API gives an exact count and limit/offset links
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='sales@test.test',
+                                             email='sales@test.test',
+                                             role='sales')
+        for i in range(5):
+            Customer.objects.create(first_name='first', last_name=f'last{i}',
+                                    phone='0102', company=f'company{i}',
+                                    email=f'customer{i}@test.test')
+
+    def test_remaining_pages(self):
+        url = 'http://testserver/api/customers/'
+        data = {'count': 5, 'next': url + '?limit=2&offset=2'}
+        self.assertEqual(get_remaining_pages(data), [
+            url + '?limit=2&offset=2', url + '?limit=2&offset=4'])
+        for data in (
+                {'next': url + '?count=none&limit=2&offset=2'},
+                {'count': 5, 'count_estimated': True,
+                 'next': url + '?count=estimate&limit=2&offset=2'},
+                {'count': 5, 'next': url + '?pagination=cursor&cursor=abc'},
+                {'count': 5, 'next': url + '?limit=2'}):
+            with self.subTest(data['next']):
+                self.assertIsNone(get_remaining_pages(data))
+
+    def test_next_links_followed(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        for query in ('count=none', 'count=estimate', 'pagination=cursor'):
+            with self.subTest(query):
+                data = get_api_mixin(
+                    request, f'customers/?{query}&limit=2', concurrency=4)
+                self.assertEqual(
+                    sorted(customer['company']
+                           for customer in data['results']),
+                    [f'company{i}' for i in range(5)])
+                self.assertIsNone(data['next'])
+
+
+class ApiPageTest(TestCase):
+    """
+    Test that the list pages fetch only the page shown from the API
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='sales@test.test',
+                                             email='sales@test.test',
+                                             role='sales')
+        for i in range(12):
+            Customer.objects.create(first_name='first', last_name=f'last{i}',
+                                    phone='0102', company=f'company{i}',
+                                    email=f'customer{i}@test.test')
+
+    def get_page(self, endpoint, **params):
+        request = RequestFactory().get('/', params)
+        request.user = self.user
+        with mock.patch.object(ApiResults, 'fetch', autospec=True,
+                               side_effect=ApiResults.fetch) as fetch:
+            data, page_obj = get_api_page(request, endpoint)
+            if page_obj is not None:
+                list(page_obj)
+        return data, page_obj, [call.args[1:] for call in fetch.mock_calls]
+
+    def test_one_api_page(self):
+        _, page_obj, fetches = self.get_page('customers/', page=2)
+        self.assertEqual(fetches, [(5, 5)])
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual([customer['company'] for customer in page_obj],
+                         [f'company{i}' for i in range(5, 10)])
+        # the pagination controls use the API's count
+        self.assertEqual(page_obj.paginator.count, 12)
+        self.assertEqual(page_obj.paginator.num_pages, 3)
+
+    def test_out_of_range_page(self):
+        _, page_obj, fetches = self.get_page('customers/', page=10)
+        self.assertEqual(fetches, [(45, 5), (10, 2)])
+        self.assertEqual(page_obj.number, 3)
+        self.assertEqual([customer['company'] for customer in page_obj],
+                         ['company10', 'company11'])
+
+    def test_api_error(self):
+        data, page_obj, _ = self.get_page(
+            'customers/?pagination=cursor&cursor=invalid')
+        self.assertIsNone(page_obj)
+        self.assertEqual(data['detail'], 'Invalid cursor')
@@ -3,9 +3,16 @@ from django.contrib.auth.views import LoginView as BaseLogin
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django import forms
-import requests
+from django.conf import settings
+from django.db import connections
 import apps.front.forms as f
+from apps.front.api_client import get_api_url, get_transport
+from apps.front.choices import get_role_choices
+from apps.authenticate.models import CustomUser
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 
 class LoginView(BaseLogin):
@@ -16,11 +23,12 @@ class LoginView(BaseLogin):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        endpoint = 'http://127.0.0.1:8000/api/login/'
+        endpoint = get_api_url() + 'login/'
         username = form['username'].value()
         password = form['password'].value()
         data = {'username': username, 'password': password}
-        tokens = requests.post(url=endpoint, data=data).json()
+        tokens = get_transport().send(self.request, 'POST', endpoint,
+                                      data).json()
         response.set_cookie('access', tokens['access'], httponly=True)
         response.set_cookie('refresh', tokens['refresh'], httponly=True)
         return response
@@ -43,25 +51,192 @@ def date_formating(date):
         return dt.strftime('Le %d/%m/%Y')
 
 
-def get_api_mixin(request, endpoint):
+def get_api_mixin(request, endpoint, concurrency=None):
     """
-    function to send a GET request to the API
+    function to send a GET request to the API, following pagination until
+    every result is fetched
     :param request: http request from view
     :param endpoint: API endpoint
+    :param concurrency: int, max number of pages fetched at the same time,
+    defaults to FRONT_API['CONCURRENCY']. With 1, pages are walked one by one
     :return: dict with json response from the API
     """
-    url = 'http://127.0.0.1:8000/api/' + endpoint
-    token = request.COOKIES.get('access')
-    head = {'Authorization': 'Bearer ' + token}
-    data = requests.get(url, headers=head).json()
+    if concurrency is None:
+        concurrency = settings.FRONT_API.get('CONCURRENCY', 1)
+    pages = iter_api_pages(request, get_api_url() + endpoint)
+    data = next(pages)
     if 'next' in data:
-        while data['next']:
-            next_page = requests.get(data['next'], headers=head).json()
-            data['results'] = data['results'] + next_page['results']
-            data['next'] = next_page['next']
+        results = list(data['results'])
+        urls = None
+        if concurrency > 1 and data['next']:
+            urls = get_remaining_pages(data)
+        if urls is not None:
+            for page in fetch_pages(request, urls, concurrency):
+                results.extend(page['results'])
+        else:
+            for page in pages:
+                results.extend(page['results'])
+        data['results'] = results
+        data['next'] = None
     return data
 
 
+def iter_api_pages(request, url):
+    """
+    generator sending GET requests to the API, yielding each page while
+    following the next links
+    :param request: http request from view
+    :param url: absolute API url
+    :return: iterator of dict with json response from the API
+    """
+    transport = get_transport()
+    while url:
+        data = transport.send(request, 'GET', url).json()
+        yield data
+        url = data.get('next')
+
+
+def iter_api_mixin(request, endpoint, page_size=None):
+    """
+    generator yielding the results of an API list endpoint page by page, so
+    only one page is held in memory at a time
+    :param request: http request from view
+    :param endpoint: API endpoint
+    :param page_size: int, number of results requested per page, defaults to
+    the API page size
+    :return: iterator of dict, one per result
+    """
+    if page_size:
+        endpoint = add_query_params(endpoint, limit=page_size, offset=0)
+    for page in iter_api_pages(request, get_api_url() + endpoint):
+        yield from page.get('results', [])
+
+
+def get_remaining_pages(data):
+    """
+    function to list the urls of the pages following the first one, using
+    the count and the limit/offset of the next link
+    :param data: dict with json response from the API for the first page
+    :return: list of urls, None without exact count (?count=none|estimate)
+    or limit/offset (?pagination=cursor), the next links are then followed
+    """
+    count = data.get('count')
+    if not isinstance(count, int) or data.get('count_estimated'):
+        return None
+    parts = urlsplit(data['next'])
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    try:
+        limit = int(query['limit'])
+        start = int(query['offset'])
+    except (KeyError, ValueError):
+        return None
+    if limit < 1:
+        return None
+    urls = []
+    for offset in range(start, count, limit):
+        query['offset'] = offset
+        urls.append(urlunsplit(parts._replace(query=urlencode(query))))
+    return urls
+
+
+def fetch_pages(request, urls, concurrency):
+    """
+    function to fetch API pages through a bounded thread pool
+    :param request: http request from view
+    :param urls: list of urls
+    :param concurrency: int, max number of threads
+    :return: list of dict with json responses, in the same order as urls
+    """
+    transport = get_transport()
+
+    def fetch(url):
+        try:
+            return transport.send(request, 'GET', url).json()
+        finally:
+            # in process transport opens a DB connection per thread
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(fetch, urls))
+
+
+PAGE_SIZE = 5
+SEARCH_PAGE_SIZE = 100
+SEARCH_MAX_RESULTS = 500
+# results shown per model when searching all of them
+SEARCH_SECTION_LIMIT = 10
+
+
+def add_query_params(endpoint, **params):
+    """
+    function to add query parameters to an API endpoint
+    :param endpoint: API endpoint, with or without query string
+    :param params: parameters to add
+    :return: string, endpoint with the parameters added
+    """
+    parts = urlsplit(endpoint)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query = [(key, value) for key, value in query if key not in params]
+    query += [(key, str(value)) for key, value in params.items()]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class ApiResults:
+    """
+    Lazy sequence over a paginated API list, used as a Paginator
+    object_list. Only the page requested is fetched from the API, with the
+    API's count used for the pagination controls.
+    """
+    def __init__(self, request, endpoint, per_page, page_number):
+        self.request = request
+        self.endpoint = endpoint
+        try:
+            page_number = max(int(page_number), 1)
+        except (TypeError, ValueError):
+            page_number = 1
+        self.offset = (page_number - 1) * per_page
+        self.data = self.fetch(self.offset, per_page)
+
+    def fetch(self, offset, limit):
+        """
+        fetch one page from the API
+        :param offset: int, index of the first result
+        :param limit: int, number of results
+        :return: dict with json response from the API
+        """
+        endpoint = add_query_params(self.endpoint, limit=limit, offset=offset)
+        url = get_api_url() + endpoint
+        return get_transport().send(self.request, 'GET', url).json()
+
+    def count(self):
+        return self.data['count']
+
+    def __getitem__(self, key):
+        if key.stop <= key.start:
+            return []
+        if key.start != self.offset:
+            self.offset = key.start
+            self.data = self.fetch(key.start, key.stop - key.start)
+        return self.data['results'][:key.stop - key.start]
+
+
+def get_api_page(request, endpoint, per_page=PAGE_SIZE):
+    """
+    function to get the page requested in ?page= from an API list endpoint
+    :param request: http request from view
+    :param endpoint: API endpoint
+    :param per_page: int, number of results per page
+    :return: tuple, dict with json response from the API and Page object
+    (None if the API returned an error)
+    """
+    page_number = request.GET.get('page')
+    results = ApiResults(request, endpoint, per_page, page_number)
+    if 'detail' in results.data:
+        return results.data, None
+    paginator = Paginator(results, per_page)
+    return results.data, paginator.get_page(page_number)
+
+
 def post_api_mixin(request, body, endpoint):
     """
     function to send a POST request to the API
@@ -70,10 +245,8 @@ def post_api_mixin(request, body, endpoint):
     :param endpoint: API endpoint
     :return: dict with json response from the API
     """
-    url = 'http://127.0.0.1:8000/api/' + endpoint
-    token = request.COOKIES.get('access')
-    head = {'Authorization': 'Bearer ' + token}
-    data = requests.post(url=url, data=body, headers=head).json()
+    url = get_api_url() + endpoint
+    data = get_transport().send(request, 'POST', url, body).json()
     return data
 
 
@@ -83,12 +256,10 @@ def patch_api_mixin(request, body, endpoint):
     :param request: http request from view
     :param body: dict with data to send to the API
     :param endpoint: API endpoint
-    :return: dict with json response from the API
+    :return: API response
     """
-    url = 'http://127.0.0.1:8000/api/' + endpoint
-    token = request.COOKIES.get('access')
-    head = {'Authorization': 'Bearer ' + token}
-    data = requests.patch(url=url, data=body, headers=head)
+    url = get_api_url() + endpoint
+    data = get_transport().send(request, 'PATCH', url, body)
     return data
 
 
@@ -99,10 +270,8 @@ def delete_api_mixin(request, endpoint):
     :param endpoint: API endpoint
     :return: None
     """
-    url = 'http://127.0.0.1:8000/api/' + endpoint
-    token = request.COOKIES.get('access')
-    head = {'Authorization': 'Bearer ' + token}
-    requests.delete(url=url, headers=head)
+    url = get_api_url() + endpoint
+    get_transport().send(request, 'DELETE', url)
 
 
 def get_group(current_user):
@@ -111,10 +280,7 @@ def get_group(current_user):
     :param current_user: user object
     :return: list of groups' name
     """
-    group_list = []
-    for group in current_user.groups.all():
-        group_list.append(group.name)
-    return group_list
+    return list(current_user.get_roles())
 
 
 @login_required
@@ -126,26 +292,20 @@ def home(request):
     """
     if 'support' in get_group(request.user):
         endpoint = 'events?support_contact=' + str(request.user.id)
-        data = get_api_mixin(request, endpoint)
+        data, page_obj = get_api_page(request, endpoint)
         if 'detail' in data:
             context = {'error': data['detail']}
         else:
-            for event in data['results']:
+            for event in page_obj:
                 event['event_date'] = date_formating(event['event_date'])
-            paginator = Paginator(data['results'], 5)
-            page_number = request.GET.get('page')
-            page_obj = paginator.get_page(page_number)
             context = {'instances': page_obj, 'events': True}
 
     elif 'sales' in get_group(request.user):
         endpoint = 'contracts?sale_contact=' + str(request.user.id)
-        data = get_api_mixin(request, endpoint)
+        data, page_obj = get_api_page(request, endpoint)
         if 'detail' in data:
             context = {'error': data['detail']}
         else:
-            paginator = Paginator(data['results'], 5)
-            page_number = request.GET.get('page')
-            page_obj = paginator.get_page(page_number)
             context = {'instances': page_obj, 'contracts': True}
     else:
         return redirect('users')
@@ -164,13 +324,10 @@ def my_customers(request):
         return redirect('home')
     else:
         endpoint = 'customers?sale_contact=' + str(request.user.id)
-        data = get_api_mixin(request, endpoint)
+        data, page_obj = get_api_page(request, endpoint)
         if 'detail' in data:
             context = {'error': data['detail']}
         else:
-            paginator = Paginator(data['results'], 5)
-            page_number = request.GET.get('page')
-            page_obj = paginator.get_page(page_number)
             context = {'instances': page_obj, 'customers': True}
         return render(request, 'front/my_customers.html', context)
 
@@ -211,9 +368,9 @@ def search(request):
     # dict used to add first part of the API's endpoint and a context keyword
     # to display proppers snippets for the results
     search_dict = {
-        'customer': ['customers?', 'customer'],
-        'contract': ['contracts?', 'contract'],
-        'event': ['events?', 'event']
+        'customer': ['customers?', 'customer', 'customers/search/'],
+        'contract': ['contracts?', 'contract', 'contracts/search/'],
+        'event': ['events?', 'event', 'events/search/']
     }
 
     # dict used to add search parameter to API's endpoint depending on the user
@@ -229,23 +386,49 @@ def search(request):
         'amount': 'amount=',
         'event_date': 'date_contains='
     }
-    if 'search_sel' in request.GET:
+    if request.GET.get('search_sel') == 'all':
+        # every model searched by the API in one request
+        context['type'] = 'all'
+        endpoint = add_query_params('search/', q=request.GET['search_input'],
+                                    limit=SEARCH_SECTION_LIMIT)
+        data = get_transport().send(request, 'GET',
+                                    get_api_url() + endpoint).json()
+        sections = data.get('results', {})
+        for record in sections.get('events', []):
+            record['event_date'] = date_formating(record['event_date'])
+        if not any(sections.values()):
+            context['empty'] = True
+        else:
+            context['sections'] = sections
+            context['meta'] = data['meta']
+        return render(request, 'front/search.html', context)
+
+    elif 'search_sel' in request.GET:
         sel = request.GET['search_sel']
         endpoint = search_dict[sel][0]
         context['type'] = search_dict[sel][1]
         type = request.GET['type']
-        endpoint = endpoint + type_dict[type] + request.GET['search_input']
+        if type == 'full_text':
+            # ranked full-text search, the best matches come first
+            endpoint = add_query_params(search_dict[sel][2],
+                                        q=request.GET['search_input'])
+        else:
+            endpoint = endpoint + type_dict[type] \
+                + request.GET['search_input']
 
-        returned_data = get_api_mixin(request, endpoint)
+        results = []
+        records = iter_api_mixin(request, endpoint, SEARCH_PAGE_SIZE)
+        for record in islice(records, SEARCH_MAX_RESULTS + 1):
+            if 'event_date' in record:
+                record['event_date'] = date_formating(record['event_date'])
+            results.append(record)
 
-        if not returned_data['results']:
+        if not results:
             context['empty'] = True
         else:
-            for event in returned_data['results']:
-                if 'event_date' in event:
-                    event['event_date'] = date_formating(
-                        event['event_date'])
-            context['results'] = returned_data['results']
+            context['truncated'] = len(results) > SEARCH_MAX_RESULTS
+            context['results'] = results[:SEARCH_MAX_RESULTS]
+            context['max_results'] = SEARCH_MAX_RESULTS
 
         return render(request, 'front/search.html', context)
 
@@ -261,13 +444,10 @@ def customers(request):
     :return: HTML template
     """
     endpoint = 'customers/'
-    data = get_api_mixin(request, endpoint)
+    data, page_obj = get_api_page(request, endpoint)
     if 'detail' in data:
         context = {'error': data['detail']}
     else:
-        paginator = Paginator(data['results'], 5)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
         context = {'instances': page_obj, 'clients': True}
     return render(request, 'front/customers.html', context)
 
@@ -287,6 +467,8 @@ def customer(request, customer_id):
     else:
         data['date_created'] = date_formating(data['date_created'])
         data['date_updated'] = date_formating(data['date_updated'])
+        if data.get('next_event_date'):
+            data['next_event_date'] = date_formating(data['next_event_date'])
         context = {'customer': data}
     return render(request, 'front/customer_details.html', context)
 
@@ -302,16 +484,15 @@ def customer_create(request):
     if 'support' in groups:
         return redirect('home')
     else:
-        users_endpoint = 'users?role=sales'
-        sales_users = get_api_mixin(request, users_endpoint)
-        form = f.CustomerEditForm(sales=sales_users['results'])
+        sales_users = get_role_choices(CustomUser.SALES)
+        form = f.CustomerEditForm(sales=sales_users)
         endpoint = 'customers/'
         if request.user.is_sales():
             form.fields['sale_contact'].widget = forms.HiddenInput()
             form.fields['sale_contact'].initial = request.user.id
         context = {'customer_form': form}
         if request.method == 'POST':
-            customer_form = f.CustomerForm(sales_users['results'],
+            customer_form = f.CustomerForm(sales_users,
                                            request.POST)
             if customer_form.is_valid():
                 data = customer_form.cleaned_data
@@ -335,14 +516,13 @@ def customer_edit(request, edit_customer_id):
     if 'support' in groups:
         return redirect('home')
     else:
-        users_endpoint = 'users?role=sales'
-        sales_users = get_api_mixin(request, users_endpoint)
-        form = f.CustomerEditForm(sales_users['results'])
+        sales_users = get_role_choices(CustomUser.SALES)
+        form = f.CustomerEditForm(sales_users)
 
         endpoint = 'customers/' \
                    + str(edit_customer_id) + '/'
         if request.method == 'POST':
-            form = f.CustomerEditForm(sales_users['results'], request.POST)
+            form = f.CustomerEditForm(sales_users, request.POST)
             if form.is_valid():
                 body = form.data
                 patch_api_mixin(request, body=body, endpoint=endpoint)
@@ -372,13 +552,10 @@ def contracts(request):
     :return: HTML template
     """
     endpoint = 'contracts/'
-    data = get_api_mixin(request, endpoint)
+    data, page_obj = get_api_page(request, endpoint)
     if 'detail' in data:
         context = {'error': data['detail']}
     else:
-        paginator = Paginator(data['results'], 5)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
         context = {'instances': page_obj}
     return render(request, 'front/contracts.html', context)
 
@@ -415,16 +592,15 @@ def contract_create(request, customer_id):
     if 'support' in groups:
         return redirect('home')
     else:
-        users_endpoint = 'users?role=sales'
-        sales_users = get_api_mixin(request, users_endpoint)
-        form = f.ContractForm(sales_users['results'])
+        sales_users = get_role_choices(CustomUser.SALES)
+        form = f.ContractForm(sales_users)
         if request.user.is_sales():
             form.fields['sale_contact'].widget = forms.HiddenInput()
             form.fields['sale_contact'].initial = request.user.id
         context = {'contract_form': form}
         if request.method == 'POST':
             endpoint = 'contracts/'
-            contract_form = f.ContractForm(sales_users['results'],
+            contract_form = f.ContractForm(sales_users,
                                            request.POST)
             if contract_form.is_valid():
                 data = contract_form.cleaned_data
@@ -452,12 +628,11 @@ def contract_edit(request, edit_cont_id):
     if 'support' in groups:
         return redirect('home')
     else:
-        users_endpoint = 'users?role=sales'
-        sales_users = get_api_mixin(request, users_endpoint)
-        form = f.ContractEditForm(sales_users['results'])
+        sales_users = get_role_choices(CustomUser.SALES)
+        form = f.ContractEditForm(sales_users)
         endpoint = 'contracts/' + str(edit_cont_id) + '/'
         if request.method == 'POST':
-            cont_form = f.ContractEditForm(sales_users['results'],
+            cont_form = f.ContractEditForm(sales_users,
                                            request.POST)
             if cont_form.is_valid():
                 body = cont_form.cleaned_data
@@ -486,15 +661,12 @@ def events(request):
     :return: HTML template
     """
     endpoint = 'events/'
-    data = get_api_mixin(request, endpoint)
+    data, page_obj = get_api_page(request, endpoint)
     if 'detail' in data:
         context = {'error': data['detail']}
     else:
-        for event in data['results']:
+        for event in page_obj:
             event['event_date'] = date_formating(event['event_date'])
-        paginator = Paginator(data['results'], 5)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
         context = {'instances': page_obj, 'events': True}
     return render(request, 'front/events.html', context)
 
@@ -532,32 +704,30 @@ def event_create(request, contract_id, customer_id):
     if 'support' in groups:
         return redirect('home')
     else:
-        users_endpoint = 'users?role=support'
-        support_users = get_api_mixin(request, users_endpoint)
-        event_form = f.EventForm(support_users['results'])
-        context = {'event_form': event_form}
+        support_users = get_role_choices(CustomUser.SUPPORT)
+        event_form = f.EventForm(support_users)
         if request.method == 'POST':
-            endpoint = 'events/'
-            event_form = f.EventForm(support_users['results'], request.POST)
+            endpoint = 'contracts/' + str(contract_id) + '/event/'
+            event_form = f.EventForm(support_users, request.POST)
             if event_form.is_valid():
                 data = event_form.cleaned_data
                 body = {
-                    'customer': customer_id,
                     'support_contact': data['support_contact'],
-                    'contract': contract_id,
                     'attendees': data['attendees'],
                     'event_date': data['event_date'],
                     'note': data['note']
                 }
                 returned_data = post_api_mixin(request, body, endpoint)
-                patch_endpoint = 'contracts/' \
-                                 + str(contract_id) + '/'
-                patch_body = {'event_created': True}
-                patch_api_mixin(request, patch_body, patch_endpoint)
-                return redirect('event_detail',
-                                event_id=str(returned_data['id']))
-        else:
-            return render(request, 'front/event_create.html', context)
+                if 'id' in returned_data:
+                    return redirect('event_detail',
+                                    event_id=str(returned_data['id']))
+                # refused by the API, e.g. the contract already has an event
+                for field, errors in returned_data.items():
+                    event_form.add_error(
+                        field if field in event_form.fields else None,
+                        errors)
+        context = {'event_form': event_form}
+        return render(request, 'front/event_create.html', context)
 
 
 @login_required
@@ -572,12 +742,11 @@ def event_edit(request, edit_event_id):
     if 'sales' in groups:
         return redirect('home')
     else:
-        users_endpoint = 'users?role=support'
-        support_users = get_api_mixin(request, users_endpoint)
-        event_form = f.EventEditForm(support_users['results'])
+        support_users = get_role_choices(CustomUser.SUPPORT)
+        event_form = f.EventEditForm(support_users)
         endpoint = 'events/' + str(edit_event_id) + '/'
         if request.method == 'POST':
-            event_form = f.EventEditForm(support_users['results'],
+            event_form = f.EventEditForm(support_users,
                                          request.POST)
             if event_form.is_valid():
                 body = event_form.cleaned_data
@@ -611,13 +780,10 @@ def users(request):
         return redirect('home')
     else:
         endpoint = 'users/'
-        data = get_api_mixin(request, endpoint)
+        data, page_obj = get_api_page(request, endpoint)
         if 'detail' in data:
             context = {'error': data['detail']}
         else:
-            paginator = Paginator(data['results'], 5)
-            page_number = request.GET.get('page')
-            page_obj = paginator.get_page(page_number)
             context = {'instances': page_obj, 'users': True}
         return render(request, 'front/users.html', context)
 
@@ -1,3 +1,4 @@
+let all = document.getElementById('all')
 let customer = document.getElementById('customer')
 let contract = document.getElementById('contract')
 let event = document.getElementById('event')
@@ -6,21 +7,31 @@ let input_field = document.getElementById('search_input')
 let search_type = document.getElementById('choices')
 
 
-let customer_choices = '<option value="last_name">Nom</option>' +
+let full_text_choice = '<option value="full_text">Plein texte</option>'
+
+let customer_choices = full_text_choice +
+    '<option value="last_name">Nom</option>' +
     '<option value="email">Email</option>' +
     '<option value="company">Société</option>'
 
-let contract_choices = '<option value="customer__last_name">Nom</option>' +
+let contract_choices = full_text_choice +
+    '<option value="customer__last_name">Nom</option>' +
     '<option value="customer__email">Email</option>' +
     '<option value="customer__company">Société</option>' +
     '<option value="date_created">Date</option>' +
     '<option value="amount">Montant</option>'
 
-let event_choices = '<option value="customer__last_name">Nom</option>' +
+let event_choices = full_text_choice +
+    '<option value="customer__last_name">Nom</option>' +
     '<option value="customer__email">Email</option>' +
     '<option value="customer__company">Société</option>' +
     '<option value="event_date">Date</option>'
 
+all.addEventListener('click', function all_change(event) {
+    search_type.innerHTML = full_text_choice;
+    input_field.type = 'text';
+});
+
 customer.addEventListener('click', function customer_change(event) {
     search_type.innerHTML = customer_choices;
 });